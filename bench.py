@@ -0,0 +1,290 @@
+"""
+database.py ke hot functions ka benchmark, bade seeded dataset par (local mongod).
+
+    python bench.py --users 1000000 --tasks 50000
+    python bench.py --reuse --baseline bench_results/bench-20260101-120000.json
+
+Results JSON me save hote hain (bench_results/). --baseline dene par har function ka p95
+aur hot queries ke explain plans compare hote hain; regression mile to exit code 1
+(deploy se pehle CI me chalao). Data alag DB (--db, default 'apex_bench') me jaata hai.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime
+from bson.objectid import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
+import database
+from config import DAILY_TASK_LIMIT, SHORTENER_CONFIG
+
+SEED_BATCH = 10000
+
+# ==========================================
+# SEED
+# ==========================================
+
+def email_for(user_id):
+    return f"bench{user_id}@example.com"
+
+async def seed(args):
+    today_str = datetime.now().strftime("%Y-%m-%d")
+    types = list(SHORTENER_CONFIG)
+    started = time.monotonic()
+
+    task_ids = [ObjectId() for _ in range(args.tasks)]
+    for i in range(0, args.tasks, SEED_BATCH):
+        await database.tasks_col.insert_many([{
+            "_id": task_ids[n],
+            "text": f"Bench Task {n}",
+            "reward": 1.0,
+            "link": f"https://example.com/b{n}",
+            "verification_code": f"B{n}",
+            "shortener_type": types[n % len(types)]
+        } for n in range(i, min(i + SEED_BATCH, args.tasks))], ordered=False)
+
+    for i in range(0, args.users, SEED_BATCH):
+        docs, completions = [], []
+        for user_id in range(i + 1, min(i + SEED_BATCH, args.users) + 1):
+            done_today = random.sample(task_ids, random.randint(0, DAILY_TASK_LIMIT - 1))
+            docs.append({
+                "user_id": user_id,
+                "first_name": f"B{user_id}",
+                "username": None,
+                "email": email_for(user_id),
+                "balance": round(random.uniform(20, 100), 2), # Withdraw success path
+                "total_withdrawn": 0.0,
+                "withdraw_count": random.randint(0, 3),
+                "referred_by": random.randint(1, user_id) if user_id > 1 and random.random() < 0.3 else None,
+                "referral_count": 0,
+                "referral_earnings": 0.0,
+                "is_banned": False,
+                "joining_date": "2025-01-01 00:00:00",
+                "last_active_date": today_str,
+                "last_renew_date": today_str if random.random() < 0.5 else None,
+                "daily_task_count": len(done_today),
+                "daily_completed_tasks": done_today
+            })
+            if user_id <= args.history_users:
+                completions.extend(
+                    {"user_id": user_id, "task_id": task_id, "completed_at": datetime.now()}
+                    for task_id in random.sample(task_ids, min(args.history, len(task_ids)))
+                )
+        await database.users_col.insert_many(docs, ordered=False)
+        if completions:
+            await database.completions_col.insert_many(completions, ordered=False)
+        print(f"🌱 Seeded {min(i + SEED_BATCH, args.users)}/{args.users} users", end="\r")
+
+    print(f"\n🌱 Seed done in {time.monotonic() - started:.1f}s")
+
+# ==========================================
+# BENCHMARKS
+# ==========================================
+
+def random_user_id(args):
+    return random.randint(1, args.users)
+
+def unique_user_ids(args):
+    """Har call naya user (write benchmarks ek user par baar baar na chalen)"""
+    ids = random.sample(range(1, args.users + 1), min(args.users, args.iterations + 5)) # + warmup
+    return iter(ids)
+
+def benchmarks(args):
+    """name -> (iterations, coroutine function). DB path ke liye user cache pehle hata dete hain."""
+    task_ids = list(database.task_pool.tasks)
+    mark_users = unique_user_ids(args)
+    plan_users = unique_user_ids(args)
+    withdraw_users = unique_user_ids(args)
+
+    async def get_user_cold():
+        user_id = random_user_id(args)
+        database.user_cache.pop(user_id)
+        await database.get_user(user_id)
+
+    async def get_user_cached():
+        await database.get_user(1)
+
+    async def is_email_registered_hit():
+        await database.is_email_registered(email_for(random_user_id(args)))
+
+    async def is_email_registered_miss():
+        await database.is_email_registered(f"missing{random.random()}@example.com")
+
+    async def get_next_task_for_user():
+        user_id = random.randint(1, max(1, min(args.users, args.history_users)))
+        database.user_cache.pop(user_id)
+        await database.get_next_task_for_user(user_id)
+
+    async def plan_daily_tasks():
+        await database.plan_daily_tasks(next(plan_users))
+
+    async def mark_task_complete():
+        await database.mark_task_complete(next(mark_users), str(random.choice(task_ids)), 1.0)
+
+    async def process_withdrawal():
+        await database.process_withdrawal(next(withdraw_users), "bench@upi")
+
+    async def get_system_stats():
+        await database.get_system_stats()
+
+    async def get_all_user_ids():
+        await database.get_all_user_ids()
+
+    n = args.iterations
+    return {
+        "get_user (db)": (n, get_user_cold),
+        "get_user (cached)": (n, get_user_cached),
+        "is_email_registered (hit)": (n, is_email_registered_hit),
+        "is_email_registered (miss)": (n, is_email_registered_miss),
+        "get_next_task_for_user": (n, get_next_task_for_user),
+        "plan_daily_tasks": (n, plan_daily_tasks),
+        "mark_task_complete": (n, mark_task_complete),
+        "process_withdrawal": (n, process_withdrawal),
+        "get_system_stats": (n, get_system_stats),
+        "get_all_user_ids": (args.full_scan_iterations, get_all_user_ids)
+    }
+
+def summarize(samples):
+    ordered = sorted(samples)
+    pick = lambda pct: ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] * 1000
+    return {
+        "count": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+        "p50_ms": round(pick(50), 3),
+        "p95_ms": round(pick(95), 3),
+        "p99_ms": round(pick(99), 3),
+        "max_ms": round(ordered[-1] * 1000, 3)
+    }
+
+async def run_benchmarks(args):
+    results = {}
+    for name, (iterations, fn) in benchmarks(args).items():
+        for _ in range(min(5, iterations)): await fn() # Warmup (connection pool, plan cache)
+        samples = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            await fn()
+            samples.append(time.perf_counter() - started)
+        results[name] = summarize(samples)
+        r = results[name]
+        print(f"⏱️ {name:<28} p50 {r['p50_ms']:>9.2f}ms  p95 {r['p95_ms']:>9.2f}ms  p99 {r['p99_ms']:>9.2f}ms")
+    await database.flush_completions()
+    return results
+
+async def explain_plans():
+    """Hot queries ka winning plan + kitne docs/keys padhe (index gaya to yahan dikhega)"""
+    today_str = datetime.now().strftime("%Y-%m-%d")
+    checks = {
+        "users.user_id": (database.users_col, {"user_id": 1}),
+        "users.email": (database.users_col, {"email": email_for(1)}),
+        "users.last_renew_date": (database.users_col, {"last_renew_date": today_str}),
+        "tasks.shortener_type": (database.tasks_col, {"shortener_type": "gplinks"}),
+        "completions.user_id": (database.completions_col, {"user_id": 1}),
+        "withdrawals.user_status": (database.withdrawals_col, {"user_id": 1, "status": "pending"})
+    }
+    plans = {}
+    for name, (col, query) in checks.items():
+        plan = await col.find(query).explain()
+        stats = plan.get("executionStats", {})
+        plans[name] = {
+            "collscan": "COLLSCAN" in str(plan.get("queryPlanner", {}).get("winningPlan", {})),
+            "docs_examined": stats.get("totalDocsExamined"),
+            "keys_examined": stats.get("totalKeysExamined"),
+            "returned": stats.get("nReturned")
+        }
+        if plans[name]["collscan"]: print(f"🐢 COLLSCAN: {name}")
+    return plans
+
+# ==========================================
+# COMPARE
+# ==========================================
+
+def compare(current, baseline, tolerance):
+    """Baseline se p95 'tolerance' guna zyada ya naya COLLSCAN = regression"""
+    problems = []
+    for name, r in current["results"].items():
+        old = baseline.get("results", {}).get(name)
+        if not old: continue
+        # Bahut chhote numbers (<1ms) par noise zyada hota hai
+        if r["p95_ms"] > max(old["p95_ms"] * tolerance, old["p95_ms"] + 1):
+            problems.append(f"{name}: p95 {old['p95_ms']}ms -> {r['p95_ms']}ms")
+    for name, plan in current["plans"].items():
+        old = baseline.get("plans", {}).get(name)
+        if old and plan["collscan"] and not old["collscan"]:
+            problems.append(f"{name}: index scan -> COLLSCAN")
+    return problems
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return None
+
+async def main(args):
+    if args.db == "ApexDigitalDB":
+        raise SystemExit("❌ Production DB par benchmark nahi chalega. --db alag rakho.")
+    client = AsyncIOMotorClient(args.mongo)
+    meta_col = client[args.db]["_bench_meta"]
+    dataset = {k: getattr(args, k) for k in ("users", "tasks", "history", "history_users")}
+
+    meta = await meta_col.find_one({"_id": "dataset"})
+    if not (args.reuse and meta and meta.get("dataset") == dataset):
+        await client.drop_database(args.db)
+        database.use_database(client[args.db])
+        await seed(args)
+        await client[args.db]["_bench_meta"].replace_one(
+            {"_id": "dataset"}, {"dataset": dataset}, upsert=True
+        )
+    else:
+        print("♻️ Existing dataset reuse ho raha hai")
+        database.use_database(client[args.db])
+
+    await database.ensure_indexes() # Seed ke baad (bulk load fast), app wale hi indexes
+    await database.reconcile_system_stats()
+    await database.load_task_pool()
+
+    report = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "mongo_version": (await client.server_info()).get("version"),
+        "dataset": dataset,
+        "iterations": args.iterations,
+        "results": await run_benchmarks(args),
+        "plans": await explain_plans()
+    }
+
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"💾 Saved: {args.out}")
+    client.close()
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            problems = compare(report, json.load(f), args.tolerance)
+        for p in problems: print(f"❌ Regression: {p}")
+        if problems: sys.exit(1)
+        print("✅ Baseline ke andar")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="database.py benchmarks")
+    parser.add_argument("--mongo", default="mongodb://localhost:27017", help="Local mongod URI")
+    parser.add_argument("--db", default="apex_bench")
+    parser.add_argument("--users", type=int, default=1000000)
+    parser.add_argument("--tasks", type=int, default=50000)
+    parser.add_argument("--history", type=int, default=50, help="Purane completions per user")
+    parser.add_argument("--history-users", type=int, default=100000, help="Kitne users ki history seed ho")
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--full-scan-iterations", type=int, default=3, help="get_all_user_ids ke runs")
+    parser.add_argument("--reuse", action="store_true", help="Same size ka seeded DB ho to dobara seed mat karo")
+    parser.add_argument("--out", default=f"bench_results/bench-{datetime.now():%Y%m%d-%H%M%S}.json")
+    parser.add_argument("--baseline", help="Purana results JSON (compare)")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="p95 itne guna badhe to regression")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,34 @@
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from metrics import TelegramMetricsMiddleware
+from outbox import OutboxMiddleware
+
+class BotRegistry:
+    """
+    Har token ka ek hi long-lived Bot. Saare bots ek shared AiohttpSession
+    (connection pool) use karte hain, har event par naya Bot/TLS nahi banta.
+    'outbox' diya ho to saare sends usi queue se jaate hain (rate limits + priority).
+    """
+
+    def __init__(self, pool_limit=100, outbox=None):
+        self.pool_limit = pool_limit
+        self.outbox = outbox
+        self.session = None
+        self.bots = {}
+
+    def get(self, token):
+        if not token: return None
+        if token not in self.bots:
+            if self.session is None:
+                self.session = AiohttpSession(limit=self.pool_limit)
+                if self.outbox: # Pehle register = sabse bahar (metrics sirf API call time le)
+                    self.session.middleware(OutboxMiddleware(self.outbox))
+                self.session.middleware(TelegramMetricsMiddleware()) # Latency/errors per API method
+            self.bots[token] = Bot(token=token, session=self.session)
+        return self.bots[token]
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+        self.session = None
+        self.bots.clear()
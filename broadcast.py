@@ -0,0 +1,126 @@
+import asyncio
+import logging
+import time
+from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest
+from aiogram.methods import SendMessage
+from database import (
+    iter_user_ids,
+    create_broadcast_job,
+    checkpoint_broadcast,
+    finish_broadcast,
+    get_running_broadcasts
+)
+from outbox import Priority
+
+SENDER_WORKERS = 20       # Ek saath kitne messages outbox me
+BATCH_SIZE = 500          # Har batch ke baad checkpoint save hoga
+PROGRESS_INTERVAL = 5     # Progress message kitne seconds me update ho
+
+class BroadcastEngine:
+    """
+    Background broadcast: cursor se IDs, outbox me BULK priority (rate limits, 429 aur
+    retries wahi sambhalta hai, payments pehle nikalte hain), aur har batch ke baad
+    Mongo me checkpoint (restart par wahi se resume).
+    """
+
+    def __init__(self, outbox, sender_bot, status_bot=None):
+        self.outbox = outbox
+        self.sender_bot = sender_bot   # User Bot (users ko message)
+        self.status_bot = status_bot   # Admin Bot (progress message edit)
+        self.running = {}              # job_id -> asyncio.Task
+
+    async def start(self, text, admin_chat_id, status_message_id):
+        job = await create_broadcast_job(text, admin_chat_id, status_message_id)
+        self._spawn(job)
+        return job["_id"]
+
+    async def resume_pending(self):
+        """Startup par adhoore broadcasts dobara shuru karo"""
+        for job in await get_running_broadcasts():
+            if job["_id"] in self.running: continue
+            logging.info(f"📢 Resuming broadcast {job['_id']} after user {job.get('last_user_id')}")
+            self._spawn(job)
+
+    def _spawn(self, job):
+        task = asyncio.create_task(self._run(job))
+        self.running[job["_id"]] = task
+        task.add_done_callback(lambda _: self.running.pop(job["_id"], None))
+
+    async def _run(self, job):
+        job_id = job["_id"]
+        counters = {k: job.get(k, 0) for k in ("sent", "failed", "blocked")}
+        last_user_id = job.get("last_user_id")
+        last_progress = 0.0
+        batch = []
+
+        try:
+            async for uid in iter_user_ids(after_user_id=last_user_id, batch_size=BATCH_SIZE):
+                batch.append(uid)
+                if len(batch) < BATCH_SIZE: continue
+
+                await self._send_batch(batch, job["text"], counters)
+                last_user_id = batch[-1]
+                batch = []
+                await checkpoint_broadcast(job_id, last_user_id, counters)
+
+                if time.monotonic() - last_progress >= PROGRESS_INTERVAL:
+                    await self._show_progress(job, counters)
+                    last_progress = time.monotonic()
+
+            if batch:
+                await self._send_batch(batch, job["text"], counters)
+                await checkpoint_broadcast(job_id, batch[-1], counters)
+
+            await finish_broadcast(job_id, "done", counters)
+            await self._show_progress(job, counters, done=True)
+            logging.info(f"📢 Broadcast {job_id} finished: {counters}")
+        except asyncio.CancelledError:
+            raise # Status 'running' hi rahega, next start par resume hoga
+        except Exception as e:
+            logging.error(f"❌ Broadcast {job_id} failed: {e}")
+            await finish_broadcast(job_id, "failed", counters)
+
+    async def _send_batch(self, user_ids, text, counters):
+        queue = asyncio.Queue()
+        for uid in user_ids:
+            queue.put_nowait(uid)
+
+        async def worker():
+            while not queue.empty():
+                uid = queue.get_nowait()
+                result = await self._send(uid, text)
+                counters[result] += 1
+
+        await asyncio.gather(*(worker() for _ in range(min(SENDER_WORKERS, len(user_ids)))))
+
+    async def _send(self, chat_id, text):
+        """Returns: 'sent', 'blocked' ya 'failed'"""
+        try:
+            await self.outbox.call(self.sender_bot, SendMessage(chat_id=chat_id, text=text), Priority.BULK)
+            return "sent"
+        except TelegramForbiddenError:
+            return "blocked" # User ne bot block kiya
+        except TelegramBadRequest:
+            return "failed"  # Chat not found / deactivated
+        except Exception:
+            return "failed"  # Retries ke baad bhi network / flood error
+
+    async def _show_progress(self, job, counters, done=False):
+        if not self.status_bot or not job.get("status_message_id"): return
+
+        processed = sum(counters.values())
+        total = max(job.get("total") or processed, processed, 1)
+        title = "✅ **Broadcast Complete!**" if done else "📢 **Broadcast Running...**"
+        text = (
+            f"{title}\n"
+            f"📊 Progress: `{processed}/{total}` ({processed * 100 // total}%)\n"
+            f"✅ Sent: `{counters['sent']}`\n"
+            f"🚫 Blocked: `{counters['blocked']}`\n"
+            f"❌ Failed: `{counters['failed']}`"
+        )
+        try:
+            await self.status_bot.edit_message_text(
+                text=text, chat_id=job["admin_chat_id"], message_id=job["status_message_id"]
+            )
+        except Exception as e:
+            logging.debug(f"Progress edit skipped: {e}")
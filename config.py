@@ -12,27 +12,55 @@ FORCE_SUB_CHANNEL_ID = os.getenv("FORCE_SUB_CHANNEL_ID")
 FORCE_SUB_LINK = os.getenv("FORCE_SUB_LINK")
 SUPPORT_BOT_USERNAME = os.getenv("SUPPORT_BOT_USERNAME")
 
-# 3 Shortener APIs
+# 3 Shortener APIs (timeout = seconds per request)
 SHORTENER_CONFIG = {
     "gplinks": {
         "url": "https://gplinks.com/api",
-        "key": os.getenv("GPLINKS_KEY")
+        "key": os.getenv("GPLINKS_KEY"),
+        "timeout": 10
     },
     "shrinkme": {
         "url": "https://shrinkme.io/api",
-        "key": os.getenv("SHRINKME_KEY")
+        "key": os.getenv("SHRINKME_KEY"),
+        "timeout": 10
     },
-    "droplink": {
+    # Tasks me type 'shrinkearn' use hota hai (env var purana hi hai)
+    "shrinkearn": {
         "url": "https://shrinkearn.com/api",
-        "key": os.getenv("DROPLINK_KEY")
+        "key": os.getenv("DROPLINK_KEY"),
+        "timeout": 10
     }
 }
+SHORTENER_RETRIES = 2 # Fail hone par kitni baar dobara try kare
+SHORT_LINK_TTL = 30 * 24 * 3600 # Short link cache kitne seconds tak valid (30 din)
+FSM_STATE_TTL = 24 * 3600 # Adhoora flow (email/withdraw) 1 din baad expire
 
 # ... Purana code ...
 
 # --- MONEY SETTINGS ---
 REFERRAL_REWARD = 5.0      # Refer karne wale ko ₹5 milenge (Jab dost withdraw karega)
+REFERRAL_LEADERBOARD_SIZE = 100 # Top kitne referrers ka board maintain hoga
 MIN_WITHDRAW_FIRST = 2.0   # Pehla withdraw ₹2 par
 MIN_WITHDRAW_NEXT = 20.0   # Uske baad ₹20 par
+DAILY_TASK_LIMIT = 6       # Ek din me max tasks
+MAX_TASK_REWARD = 100.0    # Ek task ka max reward (galat value balance me na jaye)
 # ... Purane imports ...
 PAYMENT_LOG_CHANNEL = os.getenv("PAYMENT_LOG_CHANNEL") # <--- Ye line add karein
+
+# --- WEBHOOK SETTINGS ---
+# USE_WEBHOOK=true karne par dono bots polling ki jagah webhook se updates lenge
+USE_WEBHOOK = os.getenv("USE_WEBHOOK", "false").lower() in ("1", "true", "yes")
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "").rstrip("/") # e.g. https://apex-bot.onrender.com
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") # Telegram ke secret_token header ke liye
+USER_WEBHOOK_PATH = os.getenv("USER_WEBHOOK_PATH", "/webhook/user")
+ADMIN_WEBHOOK_PATH = os.getenv("ADMIN_WEBHOOK_PATH", "/webhook/admin")
+
+# --- MULTI-WORKER (sirf webhook mode me) ---
+# 0 = sab updates main process me. N > 0 = user bot updates N worker processes me (user_id se shard)
+USER_WORKERS = int(os.getenv("USER_WORKERS", "0"))
+
+# --- PROFILING ---
+SLOW_UPDATE_THRESHOLD = float(os.getenv("SLOW_UPDATE_THRESHOLD", "1.0")) # Isse zyada seconds = slow log
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0")) # 0.01 = 1% updates par cProfile
+SLOW_LOG_TTL = 7 * 24 * 3600 # Slow update records 7 din baad delete
+DEAD_LETTER_TTL = 30 * 24 * 3600 # Na bhej paaye messages 30 din tak rakhenge
@@ -1,36 +1,205 @@
+import asyncio
 import logging
 from motor.motor_asyncio import AsyncIOMotorClient
-from config import MONGO_URI
+from config import (
+    MONGO_URI, SHORT_LINK_TTL, FSM_STATE_TTL, MIN_WITHDRAW_FIRST, MIN_WITHDRAW_NEXT,
+    DAILY_TASK_LIMIT, SLOW_LOG_TTL, DEAD_LETTER_TTL, REFERRAL_LEADERBOARD_SIZE
+)
+import time
+from enum import Enum
 from datetime import datetime
 from bson.objectid import ObjectId
+from pymongo import UpdateOne, ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure, BulkWriteError
+from task_pool import TaskPool
+from cache import LRUCache
+from metrics import MongoCommandListener
 
 # --- DB CONNECTION ---
+client = None
+db = None
+users_col = None
+tasks_col = None
+settings_col = None
+completions_col = None
+broadcasts_col = None
+short_links_col = None
+stats_col = None
+withdrawals_col = None
+fsm_col = None
+slow_col = None
+dead_letters_col = None
+scheduled_col = None
+
+def use_database(database):
+    """Saare collections is database par (load test / benchmark apna alag DB dete hain)"""
+    global db, users_col, tasks_col, settings_col, completions_col, broadcasts_col
+    global short_links_col, stats_col, withdrawals_col, fsm_col, slow_col, dead_letters_col, scheduled_col
+    db = database
+    users_col = db['users']
+    tasks_col = db['tasks']
+    settings_col = db['settings'] # For Daily Code
+    completions_col = db['completions'] # (user_id, task_id) - Kis user ne kaunsa task kiya
+    broadcasts_col = db['broadcasts'] # Broadcast jobs + checkpoint
+    short_links_col = db['short_links'] # (url, shortener_type) -> short_url cache
+    stats_col = db['stats'] # Admin dashboard ke counters (materialized)
+    withdrawals_col = db['withdrawals'] # Withdraw requests ledger (pending/approved/declined)
+    fsm_col = db['fsm_states'] # Dono bots ke FSM states (storage.MongoFSMStorage)
+    slow_col = db['slow_updates'] # Slow updates ka breakdown (profiler.py)
+    dead_letters_col = db['dead_letters'] # Permanently fail hue outgoing messages (outbox.py)
+    scheduled_col = db['scheduled_jobs'] # Lambe / restart ke baad chalne wale delayed actions (scheduler.py)
+
 if not MONGO_URI:
-    client = None
-    users_col = None
-    tasks_col = None
-    settings_col = None
     logging.error("❌ MONGO_URI missing in config!")
 else:
     try:
-        client = AsyncIOMotorClient(MONGO_URI)
-        db = client['ApexDigitalDB']
-        users_col = db['users']
-        tasks_col = db['tasks']
-        settings_col = db['settings'] # For Daily Code
+        client = AsyncIOMotorClient(MONGO_URI, event_listeners=[MongoCommandListener()]) # /metrics timings
+        use_database(client['ApexDigitalDB'])
         logging.info("✅ MongoDB Connected Successfully!")
     except Exception as e:
         logging.error(f"❌ MongoDB Connection Failed: {e}")
         client = None
 
+# ==========================================
+# STARTUP: INDEXES & SCHEMA
+# ==========================================
+
+def _index_specs():
+    """(collection, keys, options) - Hot queries ke hisaab se"""
+    return [
+        (users_col, [("user_id", ASCENDING)], {"unique": True, "name": "user_id_unique"}),
+        # Email sirf non-empty string par unique (purane docs me null ho sakta hai)
+        (users_col, [("email", ASCENDING)], {
+            "unique": True, "name": "email_unique",
+            "partialFilterExpression": {"email": {"$gt": ""}}
+        }),
+        (users_col, [("last_renew_date", ASCENDING)], {"name": "last_renew_date"}),
+        # Task delete hone par jin users ke plan me tha unhe dhundne ke liye
+        (users_col, [("daily_plan.tasks", ASCENDING)], {"name": "daily_plan_tasks"}),
+        (tasks_col, [("shortener_type", ASCENDING)], {"name": "shortener_type"}),
+        (completions_col, [("user_id", ASCENDING), ("task_id", ASCENDING)], {
+            "unique": True, "name": "user_task_unique"
+        }),
+        (withdrawals_col, [("user_id", ASCENDING), ("status", ASCENDING)], {"name": "user_status"}),
+        # Adhoore flows (email/withdraw) itne time baad expire
+        # Sirf jin users ka flow chal raha hai (clear hone par state None) - /metrics counts
+        (fsm_col, [("state", ASCENDING)], {
+            "name": "active_state", "partialFilterExpression": {"state": {"$type": "string"}}
+        }),
+        (fsm_col, [("updated_at", ASCENDING)], {
+            "name": "updated_at_ttl", "expireAfterSeconds": FSM_STATE_TTL
+        }),
+        (short_links_col, [("url", ASCENDING), ("shortener_type", ASCENDING)], {
+            "unique": True, "name": "url_shortener_unique"
+        }),
+        # Purane short links apne aap delete (shortener links bhi expire ho jate hain)
+        (short_links_col, [("created_at", ASCENDING)], {
+            "name": "created_at_ttl", "expireAfterSeconds": SHORT_LINK_TTL
+        }),
+        (slow_col, [("created_at", ASCENDING)], {
+            "name": "created_at_ttl", "expireAfterSeconds": SLOW_LOG_TTL
+        }),
+        (scheduled_col, [("run_at", ASCENDING)], {"name": "run_at"}),
+        (dead_letters_col, [("created_at", ASCENDING)], {
+            "name": "created_at_ttl", "expireAfterSeconds": DEAD_LETTER_TTL
+        }),
+    ]
+
+USERS_SCHEMA = {
+    "$jsonSchema": {
+        "bsonType": "object",
+        "required": ["user_id"],
+        "properties": {
+            "user_id": {"bsonType": ["int", "long"]},
+            "email": {"bsonType": ["string", "null"]},
+            "balance": {"bsonType": ["double", "int", "long", "decimal"]},
+            "is_banned": {"bsonType": "bool"},
+            "daily_task_count": {"bsonType": ["int", "long"]}
+        }
+    }
+}
+
+async def _apply_users_schema():
+    """Users collection par validator (sirf warn karega, writes block nahi honge)"""
+    try:
+        await db.command({
+            "collMod": users_col.name,
+            "validator": USERS_SCHEMA,
+            "validationLevel": "moderate",
+            "validationAction": "warn"
+        })
+        logging.info("🧾 Users schema validator applied.")
+    except OperationFailure as e:
+        # Atlas user ke paas collMod permission na ho to bhi bot chalna chahiye
+        logging.warning(f"⚠️ Schema validator skip: {e}")
+
+async def _log_collection_scans():
+    """Explain se check karo ki koi hot query abhi bhi COLLSCAN to nahi kar rahi"""
+    today_str = datetime.now().strftime("%Y-%m-%d")
+    checks = [
+        ("get_user", users_col, {"user_id": 0}),
+        ("get_user_by_email", users_col, {"email": "probe@example.com"}),
+        ("active_today", users_col, {"last_renew_date": today_str}),
+        ("next_task", tasks_col, {"shortener_type": "gplinks"}),
+        ("completions", completions_col, {"user_id": 0}),
+    ]
+    for name, col, query in checks:
+        try:
+            plan = await col.find(query).explain()
+        except OperationFailure as e:
+            logging.warning(f"⚠️ Explain failed for {name}: {e}")
+            continue
+        winning = plan.get("queryPlanner", {}).get("winningPlan", {})
+        if "COLLSCAN" in str(winning):
+            logging.warning(f"🐢 Collection scan: {name} on '{col.name}' {query}")
+
+async def ensure_indexes():
+    """Startup par indexes banayega. Idempotent - pehle se bane index dobara nahi banenge."""
+    if users_col is None: return
+
+    for col, keys, options in _index_specs():
+        name = options["name"]
+        existing = await col.index_information()
+        if name in existing:
+            continue
+        logging.info(f"🔨 Building index '{name}' on '{col.name}'...")
+        started = time.monotonic()
+        try:
+            await col.create_index(keys, **options)
+            logging.info(f"✅ Index '{name}' ready ({time.monotonic() - started:.1f}s)")
+        except OperationFailure as e:
+            # Unique index duplicate data ki wajah se fail ho sakta hai
+            logging.error(f"❌ Index '{name}' on '{col.name}' failed: {e}")
+
+    await _apply_users_schema()
+    await _log_collection_scans()
+
 # ==========================================
 # USER FUNCTIONS
 # ==========================================
 
+# Write-through user cache: har write naya document yahan daal deta hai.
+# TTL isliye ki doosre process (admin bot/workers) ke writes bhi jaldi dikh jayen.
+user_cache = LRUCache(maxsize=50000, ttl=120)
+
 async def get_user(user_id):
-    """User data fetch karega"""
+    """User data fetch karega (pehle cache, phir DB)"""
     if users_col is None: return None
-    return await users_col.find_one({"user_id": int(user_id)})
+    user_id = int(user_id)
+    user = user_cache.get(user_id)
+    if user is not None: return user
+    user = await users_col.find_one({"user_id": user_id})
+    if user: user_cache.set(user_id, user)
+    return user
+
+async def _update_user(user_id, update, query=None):
+    """User update + cache refresh (write-through). Filter match na ho to None."""
+    user_id = int(user_id)
+    user = await users_col.find_one_and_update(
+        {"user_id": user_id, **(query or {})}, update, return_document=ReturnDocument.AFTER
+    )
+    if user: user_cache.set(user_id, user)
+    return user
 
 async def get_user_by_email(email):
     """Email se user dhundne ke liye"""
@@ -45,13 +214,18 @@ async def is_email_registered(email):
     return user is not None
 # -----------------------------------------
 
+class RegisterResult(Enum):
+    CREATED = "created"
+    EXISTS = "exists"
+    EMAIL_TAKEN = "email_taken"
+
 async def create_user(user_id, first_name, username, email, referrer_id=None):
-    """Naya User create karega"""
+    """Naya User create karega. Returns RegisterResult."""
     if users_col is None: return
 
     # Check agar user pehle se hai
-    existing = await users_col.find_one({"user_id": int(user_id)})
-    if existing: return
+    existing = await get_user(user_id)
+    if existing: return RegisterResult.EXISTS
 
     new_user = {
         "user_id": int(user_id),
@@ -63,6 +237,7 @@ async def create_user(user_id, first_name, username, email, referrer_id=None):
         "withdraw_count": 0,
         "referred_by": int(referrer_id) if referrer_id else None,
         "referral_count": 0,
+        "referral_count_l2": 0, # Mere referrals ne jitne log laaye
         "referral_earnings": 0.0,
         "is_banned": False,
         "joining_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
@@ -71,67 +246,124 @@ async def create_user(user_id, first_name, username, email, referrer_id=None):
         "daily_task_count": 0,
         "daily_completed_tasks": []
     }
-    await users_col.insert_one(new_user)
+    try:
+        await users_col.insert_one(new_user)
+    except DuplicateKeyError as e:
+        # Unique index ne roka: same user ka double request, ya email kisi aur ka hai
+        if "email" in (e.details or {}).get("keyPattern", {}):
+            logging.info(f"⚠️ Email already registered, user {user_id} not created")
+            return RegisterResult.EMAIL_TAKEN
+        return RegisterResult.EXISTS
+    user_cache.set(int(user_id), new_user)
+    await bump_stats(total_users=1)
     logging.info(f"🆕 New User Registered: {user_id}")
 
-    # Referrer Count Update (Bonus abhi nahi milega)
+    # Referrer Count Update (Bonus abhi nahi milega) + leaderboard + level 2 (referrer ka referrer)
     if referrer_id:
-        await users_col.update_one(
-            {"user_id": int(referrer_id)},
-            {"$inc": {"referral_count": 1}}
-        )
+        referrer = await _update_user(referrer_id, {"$inc": {"referral_count": 1}})
+        if referrer:
+            changed = [referrer["user_id"]]
+            await update_referral_leaderboard(referrer)
+            if referrer.get("referred_by"):
+                if await _update_user(referrer["referred_by"], {"$inc": {"referral_count_l2": 1}}):
+                    changed.append(referrer["referred_by"])
+            # Referrer aksar doosre worker me hota hai - uska cache wahan bhi refresh ho
+            await bump_cache_version("users", *changed)
+    return RegisterResult.CREATED
 
 # ==========================================
 # WITHDRAWAL LOGIC (Bonus Removed)
 # ==========================================
 
-async def process_withdrawal(user_id, amount, upi_id):
-    """Withdraw request process karega (Bonus removed from here)"""
-    user = await users_col.find_one({"user_id": int(user_id)})
-    if not user: return "User not found"
-    
-    current_balance = user.get("balance", 0.0)
-    withdraw_count = user.get("withdraw_count", 0)
-    
-    # Limits Check
-    if withdraw_count == 0:
-        min_limit = 2.0  # First Time
-    else:
-        min_limit = 20.0 # Next Time
-        
-    if current_balance < min_limit:
-        return f"❌ Low Balance! Minimum withdraw: ₹{min_limit}"
-    
-    if amount > current_balance:
-        return "❌ Insufficient funds."
+async def process_withdrawal(user_id, upi_id):
+    """
+    Poora balance withdraw karega - ek hi conditional write me (limits + ban check).
+    Returns (withdrawal, user) success par, warna (None, error_message).
+    """
+    user_id = int(user_id)
 
-    # Deduct User Balance
-    await users_col.update_one(
-        {"user_id": int(user_id)},
-        {
-            "$inc": {"balance": -float(amount), "total_withdrawn": float(amount), "withdraw_count": 1},
-            "$set": {"last_withdraw_upi": upi_id}
+    # Limits Check DB ke andar hi: do fast taps dono pass nahi ho sakte
+    user = await _update_user(
+        user_id,
+        [{"$set": {
+            # Same stage me '$balance' purani value hi dega
+            "last_withdraw_amount": "$balance",
+            "total_withdrawn": {"$add": [{"$ifNull": ["$total_withdrawn", 0.0]}, "$balance"]},
+            "withdraw_count": {"$add": [{"$ifNull": ["$withdraw_count", 0]}, 1]},
+            "last_withdraw_upi": upi_id,
+            "balance": 0.0
+        }}],
+        query={
+            "is_banned": {"$ne": True},
+            "$or": [
+                {"withdraw_count": {"$in": [0, None]}, "balance": {"$gte": MIN_WITHDRAW_FIRST}},
+                {"withdraw_count": {"$gt": 0}, "balance": {"$gte": MIN_WITHDRAW_NEXT}}
+            ]
         }
     )
+
+    if not user:
+        # Fail hone par hi reason ke liye read karo
+        user = await get_user(user_id)
+        if not user: return None, "User not found. Press /start again."
+        if user.get("is_banned"): return None, "🚫 Transaction Failed: User Banned."
+        limit = MIN_WITHDRAW_FIRST if user.get("withdraw_count", 0) == 0 else MIN_WITHDRAW_NEXT
+        return None, f"❌ **Low Balance!**\nMin Withdraw: ₹{limit}"
+
+    amount = float(user["last_withdraw_amount"])
+    withdrawal = {
+        "user_id": user_id,
+        "amount": amount,
+        "upi_id": upi_id,
+        "status": "pending",
+        "is_first": user["withdraw_count"] == 1, # Referral bonus isi par milega
+        "created_at": datetime.now()
+    }
+    try:
+        await withdrawals_col.insert_one(withdrawal)
+    except Exception as e:
+        # Ledger row nahi bana to debit wapis - warna balance bina pending record ke gayab
+        logging.error(f"❌ Withdrawal ledger insert failed for {user_id} (₹{amount}): {e}")
+        try:
+            await _update_user(
+                user_id, {"$inc": {"balance": amount, "total_withdrawn": -amount, "withdraw_count": -1}}
+            )
+        except Exception as refund_error:
+            logging.critical(f"🚨 Withdrawal refund FAILED for {user_id}: ₹{amount} ({upi_id}): {refund_error}")
+        return None, "⚠️ Server busy. Aapka balance safe hai, thodi der baad try karein."
+    await bump_stats(total_balance=-amount)
     
     # Bonus Logic Removed from Here (Moved to Admin Approval)
     
-    return "SUCCESS" 
+    return withdrawal, user
+
+async def resolve_withdrawal(withdrawal_id, status):
+    """Pending request ko 'approved'/'declined' karega. Dobara click par None milega."""
+    try: withdrawal_id = ObjectId(withdrawal_id)
+    except: return None
+    return await withdrawals_col.find_one_and_update(
+        {"_id": withdrawal_id, "status": "pending"},
+        {"$set": {"status": status, "resolved_at": datetime.now()}},
+        return_document=ReturnDocument.AFTER
+    )
 
 async def credit_referral_bonus(referrer_id, reward):
     """Referrer ko bonus dene ke liye helper function"""
     # Yahan dhyan dein: Hum 'reward' variable use kar rahe hain, REFERRAL_REWARD nahi
-    result = await users_col.update_one(
-        {"user_id": int(referrer_id)},
+    user = await _update_user(
+        referrer_id,
         {
             "$inc": {"balance": float(reward), "referral_earnings": float(reward)}
         }
     )
-    return result.modified_count > 0
+    if user:
+        await bump_stats(total_balance=float(reward))
+        await bump_cache_version("users", referrer_id)
+    return user is not None
 
 async def get_user_referral_stats(user_id):
     """Invite page ke liye stats"""
-    user = await users_col.find_one({"user_id": int(user_id)})
+    user = await get_user(user_id)
     if user:
         return user.get("referral_count", 0)
     return 0
@@ -140,20 +372,98 @@ async def get_user_referral_stats(user_id):
 # TASK LOGIC
 # ==========================================
 
+# Active tasks ka in-memory pool (shortener_type wise)
+task_pool = TaskPool()
+
+async def load_task_pool():
+    """Tasks collection se pool refresh karega"""
+    if tasks_col is None: return
+    tasks = await tasks_col.find({}).to_list(None)
+    task_pool.load(tasks)
+    logging.info(f"🎯 Task pool loaded: {task_pool.count()} tasks.")
+
+async def task_pool_refresh_loop(interval=300):
+    """Background refresh - agar tasks kisi aur process/DB se badle hon"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await load_task_pool()
+        except Exception as e:
+            logging.error(f"❌ Task pool refresh failed: {e}")
+
 async def add_bulk_task(text, reward, short_link, code, shortener_type):
     task_data = {
         "text": text,
         "reward": float(reward),
         "link": short_link,
         "verification_code": code,
-        "shortener_type": shortener_type,
-        "users_completed": []
+        "shortener_type": shortener_type
     }
-    await tasks_col.insert_one(task_data)
+    await tasks_col.insert_one(task_data) # insert_one '_id' set kar deta hai
+    task_pool.add(task_data)
+    await bump_stats(total_tasks=1)
+    await bump_cache_version("tasks")
+
+async def add_tasks_bulk(tasks, batch_size=500):
+    """
+    Bahut saare tasks insert_many batches me (har task par alag round trip nahi).
+    Returns {index: error} - jo tasks insert nahi hue.
+    """
+    errors = {}
+    for start in range(0, len(tasks), batch_size):
+        batch = tasks[start:start + batch_size]
+        try:
+            await tasks_col.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            for err in e.details.get("writeErrors", []):
+                errors[start + err["index"]] = err.get("errmsg", "insert failed")
+        except Exception as e:
+            errors.update({start + i: str(e) for i in range(len(batch))})
+
+    inserted = [t for i, t in enumerate(tasks) if i not in errors]
+    for task in inserted: task_pool.add(task)
+    if inserted:
+        await bump_stats(total_tasks=len(inserted))
+        await bump_cache_version("tasks")
+    return errors
 
-async def get_next_task_for_user(user_id):
+def _target_shortener(daily_count):
+    """Sequence: gplinks x2, shrinkme x2, shrinkearn x2"""
+    if daily_count < 2: return "gplinks"
+    if daily_count < 4: return "shrinkme"
+    return "shrinkearn"
+
+async def _pick_task(user_id, target, exclude=()):
+    """Pool se random task jo user ne pehle kabhi nahi kiya"""
+    # Pehle kiye hue tasks (completions index se, task documents scan nahi honge)
+    done_ids = await completions_col.distinct("task_id", {"user_id": user_id})
+    if not task_pool.loaded:
+        await load_task_pool()
+    return task_pool.pick(target, exclude=set(done_ids) | set(exclude))
+
+async def plan_daily_tasks(user_id):
+    """
+    Unlock ke time aaj ke saare tasks ek saath chun kar user document par save
+    (daily_plan). Har "Start Task" par phir sirf plan ka agla task padhna hai.
+    """
     user_id = int(user_id)
-    user = await users_col.find_one({"user_id": user_id})
+    done_ids = set(await completions_col.distinct("task_id", {"user_id": user_id}))
+    if not task_pool.loaded:
+        await load_task_pool()
+
+    plan = []
+    for slot in range(DAILY_TASK_LIMIT):
+        task = task_pool.pick(_target_shortener(slot), exclude=done_ids | set(plan))
+        if task: plan.append(task["_id"])
+
+    today_str = datetime.now().strftime("%Y-%m-%d")
+    await _update_user(user_id, {"$set": {"daily_plan": {"date": today_str, "tasks": plan}}})
+    return plan
+
+async def get_next_task_for_user(user_id, user=None):
+    user_id = int(user_id)
+    if user is None:
+        user = await get_user(user_id)
     
     if not user: return None, "User not found. Press /start again."
     if user.get("is_banned"): return None, "🚫 You are BANNED from using this bot!"
@@ -162,8 +472,8 @@ async def get_next_task_for_user(user_id):
     
     # Daily Reset Logic
     if user.get("last_active_date") != today_str:
-        await users_col.update_one(
-            {"user_id": user_id},
+        await _update_user(
+            user_id,
             {"$set": {
                 "last_active_date": today_str, 
                 "daily_task_count": 0, 
@@ -176,75 +486,227 @@ async def get_next_task_for_user(user_id):
         daily_count = user.get("daily_task_count", 0)
         completed_today = user.get("daily_completed_tasks", [])
 
-    if daily_count >= 6:
-        return None, "Daily Limit (6/6) Reached! 🌙\nKal wapis aana naye tasks ke liye."
+    if daily_count >= DAILY_TASK_LIMIT:
+        return None, f"Daily Limit ({DAILY_TASK_LIMIT}/{DAILY_TASK_LIMIT}) Reached! 🌙\nKal wapis aana naye tasks ke liye."
 
-    # Sequence Logic
-    if daily_count < 2: target = "gplinks"
-    elif daily_count < 4: target = "shrinkme"
-    else: target = "shrinkearn"
+    target = _target_shortener(daily_count)
 
-    # Fetch Random Task
-    pipeline = [
-        {"$match": {
-            "shortener_type": target,
-            "users_completed": {"$ne": user_id},
-            "_id": {"$nin": completed_today}
-        }},
-        {"$sample": {"size": 1}}
-    ]
-    tasks = await tasks_col.aggregate(pipeline).to_list(1)
+    # Aaj ka plan (unlock par bana) - agla bacha hua task, bas ek _id lookup
+    plan = user.get("daily_plan") or {}
+    if plan.get("date") == today_str:
+        for task_id in plan.get("tasks", []):
+            if task_id in completed_today: continue
+            task = await get_task_details(task_id)
+            if task and task.get("shortener_type") == target:
+                return task, None
+            break # Planned task delete ho gaya - neeche live pick
+
+    # Plan nahi hai / khatam ho gaya: Pick Random Task (memory pool se, DB aggregation nahi)
+    task = await _pick_task(user_id, target, exclude=completed_today)
     
-    if not tasks: 
+    if not task: 
         return None, f"No active tasks available for {target}.\nPlease wait for Admin update."
     
-    return tasks[0], None
+    return task, None
 
 async def get_task_details(task_id):
-    try: return await tasks_col.find_one({"_id": ObjectId(task_id)})
+    try: task_id = ObjectId(task_id)
     except: return None
+    task = task_pool.get(task_id)
+    if task: return task
+    return await tasks_col.find_one({"_id": task_id})
+
+class TaskResult(Enum):
+    CREDITED = "credited"
+    ALREADY_DONE = "already_done"
+    LIMIT_REACHED = "limit_reached"
+    BANNED = "banned"
 
 async def mark_task_complete(user_id, task_id, reward):
+    """
+    Ek hi conditional write: task aaj pehle nahi kiya + limit se kam -> reward.
+    Same code do baar submit karne par dobara credit nahi hoga.
+    """
     user_id = int(user_id)
-    await users_col.update_one(
-        {"user_id": user_id},
+    task_id = ObjectId(task_id)
+    user = await _update_user(
+        user_id,
         {
             "$inc": {"balance": float(reward), "daily_task_count": 1}, 
-            "$push": {"daily_completed_tasks": ObjectId(task_id)}
+            "$push": {"daily_completed_tasks": task_id}
+        },
+        query={
+            "daily_completed_tasks": {"$ne": task_id},
+            "daily_task_count": {"$lt": DAILY_TASK_LIMIT},
+            "is_banned": {"$ne": True} # Cache purana ho tab bhi banned user ko credit nahi
         }
     )
-    await tasks_col.update_one(
-        {"_id": ObjectId(task_id)}, 
-        {"$push": {"users_completed": user_id}}
-    )
-    return True
+
+    if not user:
+        # Fail hone par hi reason ke liye fresh read
+        user = await get_user_details(user_id) or {}
+        if user.get("is_banned"):
+            return TaskResult.BANNED
+        if task_id in user.get("daily_completed_tasks", []):
+            return TaskResult.ALREADY_DONE
+        return TaskResult.LIMIT_REACHED
+
+    await bump_stats(total_balance=float(reward))
+    record_completion(user_id, task_id)
+    return TaskResult.CREDITED
+
+# Completions batch me likhe jaate hain (har task par alag insert nahi)
+_pending_completions = []
+_completion_flush_task = None
+
+def record_completion(user_id, task_id):
+    global _completion_flush_task
+    _pending_completions.append({"user_id": user_id, "task_id": task_id, "completed_at": datetime.now()})
+    if _completion_flush_task is None or _completion_flush_task.done():
+        _completion_flush_task = asyncio.create_task(_completion_flush_loop())
+
+async def flush_completions():
+    if not _pending_completions: return
+    batch = _pending_completions[:]
+    del _pending_completions[:len(batch)]
+    try:
+        await completions_col.insert_many(batch, ordered=False)
+    except BulkWriteError as e:
+        # Duplicate (11000) ignore, baaki errors log
+        errors = [err for err in e.details.get("writeErrors", []) if err.get("code") != 11000]
+        if errors:
+            logging.error(f"❌ Completion flush errors: {errors[:3]}")
+    except Exception:
+        _pending_completions[:0] = batch # Next flush me dobara try
+        raise
+
+async def _completion_flush_loop(interval=1.0):
+    while _pending_completions:
+        await asyncio.sleep(interval)
+        try:
+            await flush_completions()
+        except Exception as e:
+            logging.error(f"❌ Completion flush failed: {e}")
+
+async def migrate_task_completions(batch_size=1000):
+    """
+    Purane tasks ke 'users_completed' array ko 'completions' collection me shift karega.
+    Idempotent hai - har startup par chal sakta hai.
+    """
+    if tasks_col is None: return
+
+    migrated_tasks = 0
+    migrated_rows = 0
+    cursor = tasks_col.find({"users_completed": {"$exists": True}}, {"users_completed": 1})
+    async for task in cursor:
+        ops = [
+            UpdateOne(
+                {"user_id": int(uid), "task_id": task["_id"]},
+                {"$setOnInsert": {"completed_at": datetime.now()}},
+                upsert=True
+            )
+            for uid in task.get("users_completed", [])
+        ]
+        for i in range(0, len(ops), batch_size):
+            await completions_col.bulk_write(ops[i:i + batch_size], ordered=False)
+
+        # Array tabhi hatao jab saare rows copy ho chuke hon
+        await tasks_col.update_one({"_id": task["_id"]}, {"$unset": {"users_completed": ""}})
+        migrated_tasks += 1
+        migrated_rows += len(ops)
+
+    if migrated_tasks:
+        logging.info(f"📦 Migrated {migrated_rows} completions from {migrated_tasks} tasks.")
 
 # ==========================================
 # DAILY UNLOCK & CHECK-IN LOGIC
 # ==========================================
 
-async def set_daily_checkin_code(code):
+# Settings ka in-memory copy ({_id: value}) - har code attempt par DB read nahi
+settings_cache = {}
+settings_loaded = False
+
+async def load_settings():
+    global settings_loaded
+    docs = await settings_col.find({}).to_list(None)
+    settings_cache.clear()
+    settings_cache.update({d["_id"]: d.get("value") for d in docs})
+    settings_loaded = True
+
+async def get_setting(key, default=None):
+    if not settings_loaded:
+        await load_settings()
+    return settings_cache.get(key, default)
+
+async def set_setting(key, value):
     await settings_col.update_one(
-        {"_id": "daily_code"}, 
-        {"$set": {"value": code}}, 
+        {"_id": key}, 
+        {"$set": {"value": value}}, 
         upsert=True
     )
+    settings_cache[key] = value # Is process me turant
     return True
 
+async def watch_settings(poll_interval=30):
+    """
+    Doosre processes ke settings changes memory me laayega.
+    Change stream (replica set/Atlas) use karta hai, na chale to polling.
+    """
+    failures = 0
+    while failures < 3:
+        try:
+            async with settings_col.watch(full_document="updateLookup") as stream:
+                failures = 0
+                await load_settings() # Stream khulne ke baad resync
+                logging.info("👀 Settings change stream active.")
+                async for change in stream:
+                    key = change["documentKey"]["_id"]
+                    if change["operationType"] == "delete":
+                        settings_cache.pop(key, None)
+                    elif change.get("fullDocument"):
+                        settings_cache[key] = change["fullDocument"].get("value")
+        except OperationFailure as e:
+            # Standalone mongod par change streams nahi chalte
+            logging.warning(f"⚠️ Settings change stream unavailable ({e}). Polling every {poll_interval}s.")
+            break
+        except Exception as e:
+            failures += 1 # Connection drop: dobara try, 3 baar fail to polling
+            logging.error(f"❌ Settings watcher error: {e}")
+            await asyncio.sleep(5)
+
+    while True:
+        await asyncio.sleep(poll_interval)
+        try:
+            await load_settings()
+        except Exception as e:
+            logging.error(f"❌ Settings poll failed: {e}")
+
+async def set_daily_checkin_code(code):
+    return await set_setting("daily_code", code)
+
 async def get_daily_checkin_code():
-    data = await settings_col.find_one({"_id": "daily_code"})
-    return data['value'] if data else None
+    return await get_setting("daily_code")
 
 async def mark_user_renewed(user_id):
     today_str = datetime.now().strftime("%Y-%m-%d")
-    await users_col.update_one(
-        {"user_id": int(user_id)},
-        {"$set": {"last_renew_date": today_str}}
+    user = await _update_user(
+        user_id,
+        {"$set": {"last_renew_date": today_str}},
+        query={"last_renew_date": {"$ne": today_str}}
     )
+    # Aaj pehli baar unlock kiya to hi Active Today +1 aur aaj ka task plan
+    if user:
+        await stats_col.update_one({"_id": f"active:{today_str}"}, {"$inc": {"count": 1}}, upsert=True)
+        try:
+            await plan_daily_tasks(user_id)
+        except Exception as e:
+            # Plan na bane to bhi unlock valid hai (Start Task live pick karega)
+            logging.error(f"❌ Daily plan failed for {user_id}: {e}")
     return True
 
-async def check_user_renewed_today(user_id):
-    user = await users_col.find_one({"user_id": int(user_id)})
+async def check_user_renewed_today(user_id, user=None):
+    if user is None:
+        user = await get_user(user_id)
     if not user: return False
     today_str = datetime.now().strftime("%Y-%m-%d")
     return user.get("last_renew_date") == today_str
@@ -253,7 +715,13 @@ async def check_user_renewed_today(user_id):
 # ADMIN POWER FUNCTIONS
 # ==========================================
 
-async def get_system_stats():
+async def bump_stats(**inc):
+    """Dashboard counters ko write ke saath hi update karo ($inc atomic hai)"""
+    if stats_col is None: return
+    await stats_col.update_one({"_id": "system"}, {"$inc": inc}, upsert=True)
+
+async def reconcile_system_stats():
+    """Full scan se asli values nikal kar counters theek karega (drift fix)"""
     today_str = datetime.now().strftime("%Y-%m-%d")
     
     total_users = await users_col.count_documents({})
@@ -264,38 +732,369 @@ async def get_system_stats():
     pipeline = [{"$group": {"_id": None, "total": {"$sum": "$balance"}}}]
     res = await users_col.aggregate(pipeline).to_list(1)
     total_balance = res[0]['total'] if res else 0.0
-    
+
+    await stats_col.update_one(
+        {"_id": "system"},
+        {"$set": {
+            "total_users": total_users,
+            "total_tasks": total_tasks,
+            "total_balance": float(total_balance),
+            "reconciled_at": datetime.now()
+        }},
+        upsert=True
+    )
+    await stats_col.update_one(
+        {"_id": f"active:{today_str}"}, {"$set": {"count": active_today}}, upsert=True
+    )
+    # Purane din ke active counters ki zaroorat nahi
+    await stats_col.delete_many({"_id": {"$regex": "^active:", "$lt": f"active:{today_str}"}})
     return total_users, total_balance, total_tasks, active_today
 
+async def stats_reconcile_loop(interval=3600):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await reconcile_system_stats()
+        except Exception as e:
+            logging.error(f"❌ Stats reconcile failed: {e}")
+
+async def get_system_stats():
+    today_str = datetime.now().strftime("%Y-%m-%d")
+
+    # Sirf 2 chhote documents padhne hain, users collection scan nahi
+    docs = await stats_col.find({"_id": {"$in": ["system", f"active:{today_str}"]}}).to_list(2)
+    docs = {d["_id"]: d for d in docs}
+    system = docs.get("system")
+    if not system or "reconciled_at" not in system:
+        return await reconcile_system_stats() # Pehli baar counters banao
+
+    active_today = docs.get(f"active:{today_str}", {}).get("count", 0)
+    return (
+        system.get("total_users", 0), system.get("total_balance", 0.0),
+        system.get("total_tasks", 0), active_today
+    )
+
 async def get_recent_tasks(limit=10):
     return await tasks_col.find({}).sort("_id", -1).limit(limit).to_list(limit)
 
 async def delete_task_from_db(task_id):
     try:
-        res = await tasks_col.delete_one({"_id": ObjectId(task_id)})
+        task_id = ObjectId(task_id)
+        res = await tasks_col.delete_one({"_id": task_id})
+        task_pool.remove(task_id)
+        if res.deleted_count:
+            await bump_stats(total_tasks=-1)
+            await bump_cache_version("tasks")
+            # Jin users ke aaj ke plan me ye task tha, unke plan se hatao (aur har process ke cache se)
+            affected = await users_col.distinct("user_id", {"daily_plan.tasks": task_id})
+            if affected:
+                await users_col.update_many(
+                    {"user_id": {"$in": affected}}, {"$pull": {"daily_plan.tasks": task_id}}
+                )
+                for user_id in affected: user_cache.pop(user_id)
+                await bump_cache_version("users", *affected)
         return res.deleted_count > 0
     except: return False
 
 async def get_user_details(user_id):
-    return await users_col.find_one({"user_id": int(user_id)})
+    # Admin ko hamesha fresh data (cache bypass, lekin cache refresh)
+    user = await users_col.find_one({"user_id": int(user_id)})
+    if user: user_cache.set(int(user_id), user)
+    return user
 
 async def update_user_ban_status(user_id, status):
-    await users_col.update_one({"user_id": int(user_id)}, {"$set": {"is_banned": status}})
+    await _update_user(user_id, {"$set": {"is_banned": status}})
+    await bump_cache_version("users", user_id)
 
 async def admin_add_balance(user_id, amount):
-    await users_col.update_one({"user_id": int(user_id)}, {"$inc": {"balance": float(amount)}})
+    user = await _update_user(user_id, {"$inc": {"balance": float(amount)}})
+    if user:
+        await bump_stats(total_balance=float(amount))
+        await bump_cache_version("users", user_id)
     return True
 
 async def get_all_user_ids():
     users = await users_col.find({}, {"user_id": 1}).to_list(None)
     return [u['user_id'] for u in users]
 
+async def iter_user_ids(after_user_id=None, batch_size=500):
+    """Cursor se user IDs stream karega (user_id order me, checkpoint ke baad se)"""
+    query = {"user_id": {"$gt": after_user_id}} if after_user_id is not None else {}
+    cursor = users_col.find(query, {"user_id": 1, "_id": 0}).sort("user_id", 1).batch_size(batch_size)
+    async for u in cursor:
+        yield u['user_id']
+
 async def refund_user_balance(user_id, amount):
     """Agar Admin decline kare to paisa wapis add karo"""
-    await users_col.update_one(
-        {"user_id": int(user_id)},
+    await _update_user(
+        user_id,
         {
             "$inc": {"balance": float(amount), "total_withdrawn": -float(amount), "withdraw_count": -1}
         }
     )
-    return True
\ No newline at end of file
+    await bump_stats(total_balance=float(amount))
+    await bump_cache_version("users", user_id)
+    return True
+
+# ==========================================
+# CROSS-PROCESS CACHE SYNC
+# ==========================================
+
+# Admin process ke writes (tasks add/delete, ban, balance) user workers ke task_pool
+# aur user_cache tak: stats me ek version document, har process har kuch second padhta hai.
+CACHE_VERSIONS_ID = "cache_versions"
+CHANGED_USERS_KEEP = 500 # Itne recent changed user IDs document me rehte hain
+_seen_versions = {}
+
+async def bump_cache_version(kind, *user_ids):
+    """kind = 'tasks' ya 'users' (jin users ka document badla, har ek ke liye version +1)"""
+    if stats_col is None: return
+    update = {"$inc": {kind: max(1, len(user_ids))}}
+    if user_ids:
+        update["$push"] = {"changed_users": {
+            "$each": [int(u) for u in user_ids], "$slice": -CHANGED_USERS_KEEP
+        }}
+    try:
+        await stats_col.update_one({"_id": CACHE_VERSIONS_ID}, update, upsert=True)
+    except Exception as e:
+        logging.error(f"❌ Cache version bump failed: {e}")
+
+async def sync_caches():
+    """Version badla ho to task_pool reload / changed users cache se hatao. Pehli call sirf baseline."""
+    if stats_col is None: return
+    doc = await stats_col.find_one({"_id": CACHE_VERSIONS_ID}) or {}
+    tasks_version, users_version = doc.get("tasks", 0), doc.get("users", 0)
+
+    if "tasks" in _seen_versions and tasks_version != _seen_versions["tasks"]:
+        await load_task_pool()
+    if "users" in _seen_versions and users_version != _seen_versions["users"]:
+        missed = users_version - _seen_versions["users"]
+        changed = doc.get("changed_users", [])
+        if 0 < missed <= len(changed):
+            for user_id in changed[-missed:]: user_cache.pop(user_id)
+        else:
+            user_cache.clear() # Bahut changes chhoot gaye - poora cache hi hata do
+
+    _seen_versions.update(tasks=tasks_version, users=users_version)
+
+async def cache_sync_loop(interval=2):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await sync_caches()
+        except Exception as e:
+            logging.error(f"❌ Cache sync failed: {e}")
+
+# ==========================================
+# BROADCAST JOBS (Resume support)
+# ==========================================
+
+async def create_broadcast_job(text, admin_chat_id, status_message_id):
+    job = {
+        "text": text,
+        "status": "running",
+        "admin_chat_id": admin_chat_id,
+        "status_message_id": status_message_id,
+        "last_user_id": None, # Checkpoint: iske baad wale users ko bhejna baaki hai
+        "sent": 0,
+        "failed": 0,
+        "blocked": 0,
+        "total": await users_col.estimated_document_count(),
+        "created_at": datetime.now(),
+        "updated_at": datetime.now()
+    }
+    await broadcasts_col.insert_one(job)
+    return job
+
+async def checkpoint_broadcast(job_id, last_user_id, counters):
+    await broadcasts_col.update_one(
+        {"_id": job_id},
+        {"$set": {"last_user_id": last_user_id, "updated_at": datetime.now(), **counters}}
+    )
+
+async def finish_broadcast(job_id, status, counters):
+    await broadcasts_col.update_one(
+        {"_id": job_id},
+        {"$set": {"status": status, "updated_at": datetime.now(), **counters}}
+    )
+
+async def get_running_broadcasts():
+    if broadcasts_col is None: return []
+    return await broadcasts_col.find({"status": "running"}).to_list(None)
+
+# ==========================================
+# SHORT LINK CACHE
+# ==========================================
+
+async def get_cached_short_link(url, shortener_type):
+    """Pehle se bana short link (mila to hit count +1)"""
+    if short_links_col is None: return None
+    doc = await short_links_col.find_one_and_update(
+        {"url": url, "shortener_type": shortener_type},
+        {"$inc": {"hits": 1}},
+        projection={"short_url": 1}
+    )
+    return doc["short_url"] if doc else None
+
+async def save_short_link(url, shortener_type, short_url):
+    if short_links_col is None: return
+    await short_links_col.update_one(
+        {"url": url, "shortener_type": shortener_type},
+        {"$set": {"short_url": short_url, "created_at": datetime.now()}, "$setOnInsert": {"hits": 0}},
+        upsert=True
+    )
+
+async def bump_short_link_hits(counts):
+    """{(url, shortener_type): hits} - memory cache ke hits batch me (utils.flush_link_hits)"""
+    if short_links_col is None or not counts: return
+    await short_links_col.bulk_write([
+        UpdateOne({"url": url, "shortener_type": shortener_type}, {"$inc": {"hits": hits}})
+        for (url, shortener_type), hits in counts.items()
+    ], ordered=False)
+
+# ==========================================
+# SLOW UPDATE LOG (profiler.py)
+# ==========================================
+
+async def save_slow_update(entry):
+    if slow_col is None: return
+    try:
+        await slow_col.insert_one(entry)
+    except Exception as e:
+        logging.error(f"❌ Slow update save failed: {e}")
+
+async def get_slowest_handlers(limit=10, hours=24):
+    """Pichhle 'hours' ke slow updates, handler wise (sabse slow pehle). Saare workers ka data."""
+    if slow_col is None: return []
+    since = datetime.fromtimestamp(time.time() - hours * 3600)
+    pipeline = [
+        {"$match": {"created_at": {"$gte": since}}},
+        {"$group": {
+            "_id": {"bot": "$bot", "handler": "$handler"},
+            "count": {"$sum": 1},
+            "avg_ms": {"$avg": "$total_ms"},
+            "max_ms": {"$max": "$total_ms"},
+            "mongo_ms": {"$avg": "$mongo_ms"},
+            "telegram_ms": {"$avg": "$telegram_ms"},
+            "http_ms": {"$avg": "$http_ms"},
+            "other_ms": {"$avg": "$other_ms"}
+        }},
+        {"$sort": {"max_ms": -1}},
+        {"$limit": limit}
+    ]
+    return await slow_col.aggregate(pipeline).to_list(length=limit)
+
+# ==========================================
+# DEAD LETTERS (outbox.py)
+# ==========================================
+
+async def save_dead_letter(entry):
+    if dead_letters_col is None: return
+    try:
+        await dead_letters_col.insert_one(entry)
+    except Exception as e:
+        logging.error(f"❌ Dead letter save failed: {e}")
+
+async def get_dead_letters(limit=10):
+    if dead_letters_col is None: return []
+    return await dead_letters_col.find({}).sort("created_at", -1).limit(limit).to_list(limit)
+
+# ==========================================
+# REFERRAL LEADERBOARD (materialized)
+# ==========================================
+
+# stats collection ka ek document: {"entries": [{user_id, name, count}, ...]}
+# count ke hisaab se sorted, REFERRAL_LEADERBOARD_SIZE tak bounded
+LEADERBOARD_ID = "referral_leaderboard"
+
+async def update_referral_leaderboard(user):
+    """Referrer ka naya referral_count board me (create_user se, har naye referral par)"""
+    if stats_col is None: return
+    user_id, count = user["user_id"], user.get("referral_count", 0)
+    name = user.get("first_name") or "User"
+
+    # Pehle se board par hai: count update karke dobara sort
+    res = await stats_col.update_one(
+        {"_id": LEADERBOARD_ID, "entries.user_id": user_id},
+        {"$max": {"entries.$.count": count}, "$set": {"entries.$.name": name}}
+    )
+    if res.matched_count:
+        await stats_col.update_one(
+            {"_id": LEADERBOARD_ID}, {"$push": {"entries": {"$each": [], "$sort": {"count": -1}}}}
+        )
+        return
+
+    # Naya entry sirf tab jab board bhara nahi ya last wale se aage ho
+    last = f"entries.{REFERRAL_LEADERBOARD_SIZE - 1}"
+    await stats_col.update_one(
+        {
+            "_id": LEADERBOARD_ID,
+            "entries.user_id": {"$ne": user_id}, # Do referrals ek saath aaye to duplicate nahi
+            "$or": [{last: {"$exists": False}}, {f"{last}.count": {"$lt": count}}]
+        },
+        {"$push": {"entries": {
+            "$each": [{"user_id": user_id, "name": name, "count": count}],
+            "$sort": {"count": -1},
+            "$slice": REFERRAL_LEADERBOARD_SIZE
+        }}}
+    )
+
+async def get_referral_leaderboard(limit=REFERRAL_LEADERBOARD_SIZE):
+    """Top referrers (sorted). Ek chhota document padhna hai, users par sort nahi."""
+    if stats_col is None: return []
+    doc = await stats_col.find_one({"_id": LEADERBOARD_ID}, {"entries": {"$slice": limit}})
+    return doc.get("entries", []) if doc else []
+
+async def rebuild_referral_stats(batch_size=1000):
+    """
+    Full scan se level-2 counts aur leaderboard dobara banayega (pehli baar / drift fix).
+    Hot path par nahi chalta - startup par sirf tab jab board document na ho.
+    """
+    pipeline = [
+        {"$match": {"referred_by": {"$ne": None}, "referral_count": {"$gt": 0}}},
+        {"$group": {"_id": "$referred_by", "l2": {"$sum": "$referral_count"}}}
+    ]
+    ops = []
+    async for row in users_col.aggregate(pipeline):
+        ops.append(UpdateOne({"user_id": row["_id"]}, {"$set": {"referral_count_l2": row["l2"]}}))
+        if len(ops) >= batch_size:
+            await users_col.bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        await users_col.bulk_write(ops, ordered=False)
+
+    top = await users_col.find(
+        {"referral_count": {"$gt": 0}}, {"user_id": 1, "first_name": 1, "referral_count": 1}
+    ).sort("referral_count", -1).limit(REFERRAL_LEADERBOARD_SIZE).to_list(REFERRAL_LEADERBOARD_SIZE)
+    entries = [
+        {"user_id": u["user_id"], "name": u.get("first_name") or "User", "count": u["referral_count"]}
+        for u in top
+    ]
+    await stats_col.update_one(
+        {"_id": LEADERBOARD_ID},
+        {"$set": {"entries": entries, "rebuilt_at": datetime.now()}},
+        upsert=True
+    )
+    logging.info(f"🏆 Referral leaderboard rebuilt: {len(entries)} entries.")
+
+async def ensure_referral_leaderboard():
+    if stats_col is None: return
+    if not await stats_col.find_one({"_id": LEADERBOARD_ID}, {"_id": 1}):
+        await rebuild_referral_stats()
+
+# ==========================================
+# SCHEDULED JOBS (scheduler.py)
+# ==========================================
+
+async def save_scheduled_jobs(jobs):
+    if scheduled_col is None or not jobs: return
+    await scheduled_col.insert_many([
+        {**job, "run_at": datetime.fromtimestamp(job["run_at"])} for job in jobs
+    ])
+
+async def claim_due_scheduled_job():
+    """Ek due job utha lo (delete ke saath) - doosra process same job nahi chalayega"""
+    if scheduled_col is None: return None
+    return await scheduled_col.find_one_and_delete(
+        {"run_at": {"$lte": datetime.now()}}, sort=[("run_at", ASCENDING)]
+    )
@@ -0,0 +1,32 @@
+from aiogram import Dispatcher
+from middlewares import HandlerMetricsMiddleware
+from profiler import SlowUpdateMiddleware
+
+# Routers
+from handlers.user import user_router
+from handlers.admin import admin_router
+
+def _add_metrics(dp, bot_name):
+    dp.update.outer_middleware(SlowUpdateMiddleware(bot_name)) # Poore update ka time + breakdown
+    # Dispatcher ke inner middlewares included routers ke handlers par bhi chalte hain
+    for name, observer in dp.observers.items():
+        if name in ("update", "error"): continue
+        observer.middleware(HandlerMetricsMiddleware(name))
+
+# NOTE: Ek router ek process me sirf ek dispatcher me include ho sakta hai,
+# isliye dispatchers import par nahi, in functions se bante hain
+# (main process aur har user worker process apna dispatcher banata hai).
+
+def create_user_dispatcher(storage=None, **workflow_data):
+    """User Bot: sirf User wale commands (Tasks, Balance). workflow_data handlers me inject hota hai."""
+    dp = Dispatcher(storage=storage, **workflow_data)
+    dp.include_router(user_router)
+    _add_metrics(dp, "user")
+    return dp
+
+def create_admin_dispatcher(storage=None, **workflow_data):
+    """Admin Bot: sirf Admin wale commands (Add Task, Ban)"""
+    dp = Dispatcher(storage=storage, **workflow_data)
+    dp.include_router(admin_router)
+    _add_metrics(dp, "admin")
+    return dp
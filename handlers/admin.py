@@ -1,5 +1,4 @@
-import asyncio
-from aiogram import Router, types, F, Bot
+from aiogram import Router, types, F
 from aiogram.filters import Command, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
@@ -14,14 +13,19 @@ from database import (
     get_user_by_email,
     update_user_ban_status,
     admin_add_balance, 
-    get_all_user_ids,
     set_daily_checkin_code,
     refund_user_balance,
-    credit_referral_bonus # <--- Added for Bonus
+    resolve_withdrawal,
+    credit_referral_bonus, # <--- Added for Bonus
+    get_slowest_handlers,
+    get_dead_letters,
+    get_referral_leaderboard
 )
-from utils import shorten_link
+from utils import shorten_links_batch, get_link_cache_stats, format_leaderboard
+from scheduler import scheduled_action
+from task_import import import_tasks, report_to_csv, parse_reward
 # REFERRAL_REWARD ko config se import karna na bhulein
-from config import ADMIN_IDS, BOT_TOKEN, REFERRAL_REWARD 
+from config import ADMIN_IDS, REFERRAL_REWARD, REFERRAL_LEADERBOARD_SIZE, MAX_TASK_REWARD
 
 admin_router = Router()
 
@@ -38,6 +42,7 @@ class AdminState(StatesGroup):
     task_code = State()
     waiting_for_shortener_selection = State()
     waiting_for_daily_code = State()
+    waiting_for_task_file = State()
 
 # ==========================================
 # 🛠️ HELPER: KEYBOARDS
@@ -47,10 +52,11 @@ def get_admin_dashboard_kb():
     kb.button(text="➕ Add New Task", callback_data="btn_add_task")
     kb.button(text="🔑 Set Check-in Code", callback_data="btn_set_code")
     kb.button(text="🗑️ Manage Tasks", callback_data="btn_manage_tasks")
+    kb.button(text="📥 Import Tasks", callback_data="btn_import_tasks")
     kb.button(text="👤 Search User", callback_data="btn_search_user")
     kb.button(text="📢 Broadcast", callback_data="btn_broadcast")
     kb.button(text="🔄 Refresh Stats", callback_data="btn_refresh")
-    kb.adjust(2, 1, 2, 1)
+    kb.adjust(2, 2, 2, 1)
     return kb.as_markup()
 
 def get_cancel_kb():
@@ -61,15 +67,11 @@ def get_cancel_kb():
 # ==========================================
 # 1. MAIN DASHBOARD
 # ==========================================
-@admin_router.message(Command("start", "admin"))
-async def admin_dashboard(message: types.Message, state: FSMContext):
-    if not is_auth(message.from_user.id): return
-    await state.clear() 
-
+async def get_dashboard_text():
     # Unpack 4 values
     users, balance, tasks, active_today = await get_system_stats()
     
-    msg = (
+    return (
         "🛡️ **ADMIN CONTROL PANEL** 🛡️\n"
         "━━━━━━━━━━━━━━━━━━\n"
         f"👥 **Total Users:** `{users}`\n"
@@ -79,23 +81,23 @@ async def admin_dashboard(message: types.Message, state: FSMContext):
         "━━━━━━━━━━━━━━━━━━\n"
         "👇 **Select an Action:**"
     )
-    await message.answer(msg, reply_markup=get_admin_dashboard_kb())
+
+@admin_router.message(Command("start", "admin"))
+async def admin_dashboard(message: types.Message, state: FSMContext):
+    if not is_auth(message.from_user.id): return
+    await state.clear() 
+    await message.answer(await get_dashboard_text(), reply_markup=get_admin_dashboard_kb())
+
+@scheduled_action("admin_dashboard")
+async def send_admin_dashboard(bot, chat_id):
+    """Scheduler se (e.g. task create hone ke 2 sec baad naya dashboard)"""
+    await bot.send_message(chat_id, await get_dashboard_text(), reply_markup=get_admin_dashboard_kb())
 
 @admin_router.callback_query(F.data == "btn_refresh")
 async def refresh_stats(callback: types.CallbackQuery):
     if not is_auth(callback.from_user.id): return
     
-    users, balance, tasks, active_today = await get_system_stats()
-    msg = (
-        "🛡️ **ADMIN CONTROL PANEL** 🛡️\n"
-        "━━━━━━━━━━━━━━━━━━\n"
-        f"👥 **Total Users:** `{users}`\n"
-        f"🟢 **Active Today:** `{active_today}`\n"
-        f"💰 **Total Liability:** `₹{balance:.2f}`\n"
-        f"📋 **Active Tasks:** `{tasks}`\n"
-        "━━━━━━━━━━━━━━━━━━\n"
-        "👇 **Select an Action:**"
-    )
+    msg = await get_dashboard_text()
     try: await callback.message.edit_text(msg, reply_markup=get_admin_dashboard_kb())
     except: await callback.answer("Stats are up to date!")
 
@@ -132,12 +134,13 @@ async def set_title(m: types.Message, state: FSMContext):
 
 @admin_router.message(StateFilter(AdminState.task_reward))
 async def set_reward(m: types.Message, state: FSMContext):
-    try:
-        r = float(m.text)
-        await state.update_data(reward=r)
-        await state.set_state(AdminState.task_link)
-        await m.answer("🔗 **Step 3/4:** Enter Link:", reply_markup=get_cancel_kb())
-    except: await m.answer("❌ Invalid Number.")
+    r = parse_reward(m.text or "")
+    if r is None:
+        await m.answer(f"❌ Invalid Number. (0 se zyada, max ₹{MAX_TASK_REWARD:g})")
+        return
+    await state.update_data(reward=r)
+    await state.set_state(AdminState.task_link)
+    await m.answer("🔗 **Step 3/4:** Enter Link:", reply_markup=get_cancel_kb())
 
 @admin_router.message(StateFilter(AdminState.task_link))
 async def set_link(m: types.Message, state: FSMContext):
@@ -160,7 +163,7 @@ async def set_code_and_ask_type(m: types.Message, state: FSMContext):
     await state.set_state(AdminState.waiting_for_shortener_selection)
 
 @admin_router.callback_query(StateFilter(AdminState.waiting_for_shortener_selection))
-async def final_create_task(c: types.CallbackQuery, state: FSMContext):
+async def final_create_task(c: types.CallbackQuery, state: FSMContext, scheduler):
     choice = c.data
     data = await state.get_data()
     target_shorteners = []
@@ -175,17 +178,129 @@ async def final_create_task(c: types.CallbackQuery, state: FSMContext):
     await c.message.edit_text(msg_text)
     try:
         count = 0
+        # Teeno shorteners parallel me (ek slow provider baaki ko nahi rokega)
+        short_links = await shorten_links_batch(data['link'], target_shorteners)
         for s in target_shorteners:
-            short = await shorten_link(data['link'], s)
-            await add_bulk_task(f"{data['title']} ({s.upper()})", data['reward'], short, data['code'], s)
+            await add_bulk_task(f"{data['title']} ({s.upper()})", data['reward'], short_links[s], data['code'], s)
             count += 1
         await c.message.edit_text(f"✅ **Success!** Created {count} Task(s).\n📌 Title: {data['title']}")
     except Exception as e:
         await c.message.edit_text(f"❌ Error: {e}")
     
     await state.clear()
-    await asyncio.sleep(2)
-    await admin_dashboard(c.message, state)
+    # Result 2 sec dikhao, phir naya dashboard (handler wait nahi karta)
+    await scheduler.schedule(2, "admin_dashboard", bot="admin", chat_id=c.message.chat.id)
+
+# --- BULK IMPORT (CSV/JSON file) ---
+MAX_IMPORT_FILE_SIZE = 2 * 1024 * 1024
+
+@admin_router.callback_query(F.data == "btn_import_tasks")
+async def ask_task_file(c: types.CallbackQuery, state: FSMContext):
+    await state.set_state(AdminState.waiting_for_task_file)
+    await c.message.answer(
+        "📥 **Bulk Import**\n\n"
+        "CSV ya JSON file bhejein. Columns:\n"
+        "`title, reward, link, code, shortener`\n\n"
+        "shortener = gplinks / shrinkme / shrinkearn / all (khali = all)",
+        reply_markup=get_cancel_kb()
+    )
+    await c.answer()
+
+@admin_router.message(StateFilter(AdminState.waiting_for_task_file), F.document)
+async def process_task_file(m: types.Message, state: FSMContext):
+    doc = m.document
+    name = doc.file_name or "tasks.csv"
+    if not name.lower().endswith((".csv", ".json")):
+        await m.answer("❌ Sirf .csv ya .json file."); return
+    if doc.file_size and doc.file_size > MAX_IMPORT_FILE_SIZE:
+        await m.answer("❌ File bahut badi hai (max 2 MB)."); return
+
+    status = await m.answer("⏳ Importing...")
+    try:
+        content = (await m.bot.download(doc)).read()
+        report = await import_tasks(name, content)
+    except Exception as e:
+        await status.edit_text(f"❌ Import failed: {e}", parse_mode=None)
+        return
+
+    ok = sum(r["status"] == "ok" for r in report)
+    warn = sum(r["status"] == "warn" for r in report)
+    failed = [r for r in report if r["status"] == "error"]
+    lines = [
+        "📥 **Import Complete!**",
+        f"✅ Created: `{ok + warn}` task(s)" + (f" (⚠️ {warn} bina short link)" if warn else ""),
+        f"❌ Failed rows: `{len(failed)}`"
+    ]
+    for r in failed[:15]:
+        lines.append(f"• Row {r['row']}: {r['detail']}")
+    await state.clear()
+    await status.edit_text("\n".join(lines))
+
+    # Poori per-row report file me
+    await m.answer_document(
+        types.BufferedInputFile(report_to_csv(report), filename=f"import_report_{name.rsplit('.', 1)[0]}.csv")
+    )
+
+@admin_router.message(Command("linkcache"))
+async def show_link_cache_stats(message: types.Message):
+    if not is_auth(message.from_user.id): return
+    st = get_link_cache_stats()
+    await message.answer(
+        "🔗 **Short Link Cache**\n"
+        f"⚡ Memory Hits: `{st['memory_hits']}`\n"
+        f"🗄️ DB Hits: `{st['db_hits']}`\n"
+        f"🌐 Misses (API calls): `{st['misses']}`"
+    )
+
+@admin_router.message(Command("slow"))
+async def show_slow_handlers(message: types.Message):
+    """/slow ya /slow 20 - pichhle 24 ghante ke sabse slow handlers"""
+    if not is_auth(message.from_user.id): return
+    parts = message.text.split()
+    limit = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 10
+    rows = await get_slowest_handlers(min(limit, 50))
+    if not rows:
+        await message.answer("✅ Pichhle 24 ghante me koi slow update nahi.")
+        return
+
+    lines = ["🐢 **Slowest Handlers (24h)**"]
+    for r in rows:
+        lines.append(
+            f"\n`{r['_id']['bot']}:{r['_id'].get('handler')}` ×{r['count']}\n"
+            f"max `{r['max_ms']:.0f}ms` | avg `{r['avg_ms']:.0f}ms`\n"
+            f"🗄️ `{r['mongo_ms']:.0f}` | ✈️ `{r['telegram_ms']:.0f}` | "
+            f"🌐 `{r['http_ms']:.0f}` | ⚙️ `{r['other_ms']:.0f}` ms (avg)"
+        )
+    await message.answer("\n".join(lines))
+
+@admin_router.message(Command("leaderboard"))
+async def show_leaderboard(message: types.Message):
+    """/leaderboard ya /leaderboard 50 - top referrers (materialized board se)"""
+    if not is_auth(message.from_user.id): return
+    parts = message.text.split()
+    limit = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 20
+    board = await get_referral_leaderboard(min(limit, REFERRAL_LEADERBOARD_SIZE))
+    if not board:
+        await message.answer("🏆 Abhi tak koi referral nahi.")
+        return
+    lines = [f"{line} | ID `{e['user_id']}`" for line, e in zip(format_leaderboard(board).split("\n"), board)]
+    await message.answer("🏆 **Referral Leaderboard**\n\n" + "\n".join(lines))
+
+@admin_router.message(Command("deadletters"))
+async def show_dead_letters(message: types.Message):
+    """Jo messages retries ke baad bhi nahi gaye (approval/referral notices, payment alerts)"""
+    if not is_auth(message.from_user.id): return
+    rows = await get_dead_letters(10)
+    if not rows:
+        await message.answer("✅ Koi dead letter nahi.")
+        return
+    lines = ["📭 **Dead Letters (latest 10)**"]
+    for r in rows:
+        lines.append(
+            f"\n🕒 {r['created_at']:%d %b %H:%M} | {r.get('priority')} | `{r.get('chat_id')}`\n"
+            f"⚠️ {r.get('error', '')[:120]}"
+        )
+    await message.answer("\n".join(lines), parse_mode=None)
 
 # ==========================================
 # 4. MANAGE TASKS
@@ -267,49 +382,56 @@ async def process_add_balance(m: types.Message, state: FSMContext):
 # 🔥 WITHDRAW APPROVAL LOGIC (Fixed)
 # ==========================================
 @admin_router.callback_query(F.data.startswith("wd_"))
-async def handle_withdraw_action(c: types.CallbackQuery):
+async def handle_withdraw_action(c: types.CallbackQuery, user_bot, outbox):
     parts = c.data.split("_")
     action = parts[1] # 'y' or 'n'
-    user_id = int(parts[2])
-    amount = float(parts[3])
-    
-    # User Bot se notification bhejna hai
-    user_bot = Bot(token=BOT_TOKEN)
+
+    if len(parts) == 4:
+        # Purane buttons (wd_y_{user_id}_{amount}) - ledger se pehle ke requests
+        user = await get_user(int(parts[2]))
+        withdrawal = {
+            "user_id": int(parts[2]),
+            "amount": float(parts[3]),
+            "is_first": bool(user and user.get("withdraw_count") == 1)
+        }
+    else:
+        # Pending -> approved/declined sirf ek baar hoga (double click safe)
+        withdrawal = await resolve_withdrawal(parts[2], "approved" if action == "y" else "declined")
+        if not withdrawal:
+            await c.answer("⚠️ Request already processed!", show_alert=True)
+            return
+
+    user_id = withdrawal["user_id"]
+    amount = withdrawal["amount"]
     
+    # User Bot se notification bhejna hai (main.py se inject hota hai).
+    # Outbox PAYMENT priority se bhejta hai - broadcast chal raha ho tab bhi pehle jayega,
+    # 429 par retry karega aur fail hone par dead_letters me record rahega.
     if action == "y":
         # -----------------------------------------------
         # ✅ REFERRAL BONUS LOGIC ADDED HERE
         # -----------------------------------------------
-        # Check karein user ka data
-        user = await get_user(user_id)
-        
-        # Logic: Withdraw Request ke time count 1 ho gaya tha.
-        # Isliye agar count == 1 hai, matlab ye Pehla Withdraw hai.
-        if user and user.get("withdraw_count") == 1:
-            referrer_id = user.get("referred_by")
+        # Logic: Request ke time hi 'is_first' save ho gaya tha (Pehla Withdraw)
+        if withdrawal.get("is_first"):
+            user = await get_user(user_id)
+            referrer_id = user.get("referred_by") if user else None
             
             if referrer_id:
                 # Bonus Dein
                 await credit_referral_bonus(referrer_id, REFERRAL_REWARD)
                 
                 # Referrer ko Notify karein
-                try:
-                    await user_bot.send_message(
-                        chat_id=referrer_id,
-                        text=f"🎉 **Congratulations!**\n\nAapke friend ne apna pehla withdrawal kiya hai.\nAapko **₹{REFERRAL_REWARD}** ka Referral Bonus mila hai! 💰"
-                    )
-                except Exception as e:
-                    print(f"Referrer Notify Error: {e}")
+                outbox.notify(
+                    user_bot, referrer_id,
+                    f"🎉 **Congratulations!**\n\nAapke friend ne apna pehla withdrawal kiya hai.\nAapko **₹{REFERRAL_REWARD}** ka Referral Bonus mila hai! 💰"
+                )
         # -----------------------------------------------
 
         # User ko Success msg bhejein
-        try:
-            await user_bot.send_message(
-                chat_id=user_id,
-                text=f"✅ **Withdrawal Approved!**\n\n💰 Amount: ₹{amount}\n🎉 Paisa aapke account me bhej diya gaya hai."
-            )
-        except Exception as e:
-            print(f"Notify Error: {e}")
+        outbox.notify(
+            user_bot, user_id,
+            f"✅ **Withdrawal Approved!**\n\n💰 Amount: ₹{amount}\n🎉 Paisa aapke account me bhej diya gaya hai."
+        )
             
         await c.message.edit_text(c.message.text + "\n\n✅ **APPROVED BY ADMIN**")
         
@@ -317,17 +439,13 @@ async def handle_withdraw_action(c: types.CallbackQuery):
         # Decline: Refund Balance & Send Fail Message
         await refund_user_balance(user_id, amount)
         
-        try:
-            await user_bot.send_message(
-                chat_id=user_id,
-                text=f"❌ **Withdrawal Declined!**\n\n💰 Amount: ₹{amount}\n⚠️ Aapka paisa wapis wallet me add kar diya gaya hai.\nReason: Invalid Details."
-            )
-        except Exception as e:
-            print(f"Notify Error: {e}")
+        outbox.notify(
+            user_bot, user_id,
+            f"❌ **Withdrawal Declined!**\n\n💰 Amount: ₹{amount}\n⚠️ Aapka paisa wapis wallet me add kar diya gaya hai.\nReason: Invalid Details."
+        )
             
         await c.message.edit_text(c.message.text + "\n\n❌ **DECLINED & REFUNDED**")
         
-    await user_bot.session.close() # Close session
     await c.answer()
 
 # ==========================================
@@ -340,24 +458,14 @@ async def start_broadcast(c: types.CallbackQuery, state: FSMContext):
     await c.answer()
 
 @admin_router.message(StateFilter(AdminState.waiting_for_broadcast))
-async def send_broadcast(m: types.Message, state: FSMContext):
+async def send_broadcast(m: types.Message, state: FSMContext, broadcaster):
     msg_text = m.text
     status = await m.answer("⏳ Sending...")
-    user_bot_sender = Bot(token=BOT_TOKEN)
-    ids = await get_all_user_ids()
-    count = 0
     
-    for uid in ids:
-        try:
-            await user_bot_sender.send_message(uid, f"📢 **NOTICE**\n\n{msg_text}")
-            count += 1
-            await asyncio.sleep(0.05)
-        except: pass
+    # Background me chalega (progress isi message me update hoga), admin free rahega
+    await broadcaster.start(f"📢 **NOTICE**\n\n{msg_text}", m.chat.id, status.message_id)
     
-    await user_bot_sender.session.close()
-    await status.edit_text(f"✅ Sent to {count} users.")
     await state.clear()
-    await asyncio.sleep(2)
     await admin_dashboard(m, state)
 
 # ==========================================
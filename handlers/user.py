@@ -1,12 +1,10 @@
 import re
-import asyncio # Required for delay
-from aiogram import Router, types, F, Bot
+from aiogram import Router, types, F
 from aiogram.filters import Command, StateFilter, CommandStart, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.utils.keyboard import InlineKeyboardBuilder, ReplyKeyboardBuilder
 from database import (
-    get_user, 
     create_user, 
     is_email_registered,
     get_next_task_for_user, 
@@ -17,15 +15,24 @@ from database import (
     get_daily_checkin_code,
     credit_referral_bonus,
     get_user_referral_stats,
-    process_withdrawal
+    get_referral_leaderboard,
+    process_withdrawal,
+    TaskResult,
+    RegisterResult
 )
 from config import (
     FORCE_SUB_CHANNEL_ID, FORCE_SUB_LINK, SUPPORT_BOT_USERNAME, 
-    REFERRAL_REWARD, MIN_WITHDRAW_FIRST, MIN_WITHDRAW_NEXT, 
-    PAYMENT_LOG_CHANNEL, ADMIN_BOT_TOKEN
+    REFERRAL_REWARD, MIN_WITHDRAW_FIRST, MIN_WITHDRAW_NEXT, DAILY_TASK_LIMIT,
+    PAYMENT_LOG_CHANNEL
 )
+from middlewares import UserMiddleware
+from utils import format_leaderboard
+from cache import LRUCache
 
 user_router = Router()
+# User document har update par ek hi baar load hoga -> handlers me 'user'
+user_router.message.outer_middleware(UserMiddleware())
+user_router.callback_query.outer_middleware(UserMiddleware())
 
 # --- STATES ---
 class UserState(StatesGroup):
@@ -61,16 +68,27 @@ def get_join_channel_kb():
     kb.adjust(1)
     return kb.as_markup()
 
-async def is_user_subscribed(bot, user_id):
+# get_chat_member ka TTL cache (Telegram rate limit + har button par 100-300ms bachane ke liye)
+SUB_CACHE_TTL = 600       # Member hai -> 10 min
+SUB_CACHE_NEGATIVE_TTL = 20 # Member nahi hai -> jaldi dobara check
+subscription_cache = LRUCache(maxsize=100000)
+
+def is_member_status(status):
+    return status in ['creator', 'administrator', 'member']
+
+async def is_user_subscribed(bot, user_id, fresh=False):
+    if not fresh:
+        cached = subscription_cache.get(user_id)
+        if cached is not None: return cached
     try:
         channel_id = int(FORCE_SUB_CHANNEL_ID)
         member = await bot.get_chat_member(chat_id=channel_id, user_id=user_id)
-        if member.status in ['creator', 'administrator', 'member']:
-            return True
-        return False
+        subscribed = is_member_status(member.status)
+        subscription_cache.set(user_id, subscribed, ttl=SUB_CACHE_TTL if subscribed else SUB_CACHE_NEGATIVE_TTL)
+        return subscribed
     except Exception as e:
         print(f"[ERROR] Force Sub Check Failed: {e}")
-        return False 
+        return False # Error cache nahi karte
 
 async def check_and_show_dashboard(message, user_id, first_name):
     if await is_user_subscribed(message.bot, user_id):
@@ -89,9 +107,8 @@ async def check_and_show_dashboard(message, user_id, first_name):
 # 1. START COMMAND (Referral Tracking)
 # ==========================================
 @user_router.message(CommandStart())
-async def cmd_start(message: types.Message, command: CommandObject, state: FSMContext):
+async def cmd_start(message: types.Message, command: CommandObject, state: FSMContext, user=None):
     user_id = message.from_user.id
-    user = await get_user(user_id)
 
     if user:
         if user.get("is_banned", False):
@@ -127,14 +144,19 @@ async def process_email(message: types.Message, state: FSMContext):
     data = await state.get_data()
     referrer_id = data.get("referrer_id")
 
-    await create_user(message.from_user.id, message.from_user.first_name, message.from_user.username, email, referrer_id)
+    result = await create_user(message.from_user.id, message.from_user.first_name, message.from_user.username, email, referrer_id)
+    if result == RegisterResult.EMAIL_TAKEN:
+        # Check aur insert ke beech kisi aur ne same email le liya (unique index)
+        await message.answer("⚠️ **Email Already Used!**\nYeh email pehle se registered hai. Kripya naya email dein.")
+        return
     
     await state.clear()
     await check_and_show_dashboard(message, message.from_user.id, message.from_user.first_name)
 
 @user_router.callback_query(F.data == "check_subscription")
 async def verify_click(callback: types.CallbackQuery):
-    if await is_user_subscribed(callback.bot, callback.from_user.id):
+    # User ne abhi join kiya hoga - cache skip karo
+    if await is_user_subscribed(callback.bot, callback.from_user.id, fresh=True):
         await callback.message.delete()
         await callback.message.answer(
             "✅ **Verified!** Access Granted.\nAb **🔓 Unlock Task Today** par click karein 👇", 
@@ -147,7 +169,7 @@ async def verify_click(callback: types.CallbackQuery):
 # 🔥 3-STEP SECURE UNLOCK LOGIC
 # ==========================================
 @user_router.message(F.text == "🔓 Unlock Task Today")
-async def unlock_task_request(message: types.Message):
+async def unlock_task_request(message: types.Message, scheduler):
     # 1. Link Preparation
     channel_link = str(FORCE_SUB_LINK).strip()
     if not channel_link.startswith("http"):
@@ -165,19 +187,16 @@ async def unlock_task_request(message: types.Message):
         reply_markup=kb_initial.as_markup()
     )
 
-    # 3. Wait for 3 Seconds
-    await asyncio.sleep(3)
-
-    # 4. Update Message (Show Submit Button)
+    # 3. 3 Second baad Submit button (scheduler edit karega, handler yahin free)
     kb_final = InlineKeyboardBuilder()
     kb_final.button(text="🔴 Open & Unlock", url=channel_link)
     kb_final.button(text="✅ Submit & Unlock", callback_data="ask_daily_code")
     kb_final.adjust(1)
 
-    try:
-        await msg.edit_reply_markup(reply_markup=kb_final.as_markup())
-    except:
-        pass 
+    await scheduler.schedule(
+        3, "edit_reply_markup", bot="user",
+        chat_id=msg.chat.id, message_id=msg.message_id, reply_markup=kb_final.as_markup()
+    )
 
 # --- ASK CODE HANDLER ---
 @user_router.callback_query(F.data == "ask_daily_code")
@@ -214,7 +233,7 @@ async def verify_daily_code(m: types.Message, state: FSMContext):
 # ==========================================
 @user_router.message(F.text == "🚀 Start Task")
 @user_router.message(Command("tasks"))
-async def cmd_get_task(message: types.Message):
+async def cmd_get_task(message: types.Message, user=None):
     user_id = message.from_user.id
 
     if not await is_user_subscribed(message.bot, user_id):
@@ -222,7 +241,7 @@ async def cmd_get_task(message: types.Message):
         return
 
     # Unlock Check
-    if not await check_user_renewed_today(user_id):
+    if not await check_user_renewed_today(user_id, user):
         await message.answer(
             "🛑 **Tasks Locked!**\n\n"
             "1. **'🔓 Unlock Task Today'** par click karein.\n"
@@ -231,7 +250,7 @@ async def cmd_get_task(message: types.Message):
         )
         return
 
-    task, err = await get_next_task_for_user(user_id)
+    task, err = await get_next_task_for_user(user_id, user)
     if not task: await message.answer(f"⚠️ {err}"); return
 
     kb = InlineKeyboardBuilder()
@@ -259,8 +278,11 @@ async def verify_task_code(m: types.Message, state: FSMContext):
     if not t: await m.answer("Expired."); await state.clear(); return
     
     if m.text.strip() == t["verification_code"]:
-        if await mark_task_complete(m.from_user.id, str(t["_id"]), t["reward"]): await m.answer("✅ Added.")
-        else: await m.answer("⚠️ Done.")
+        result = await mark_task_complete(m.from_user.id, str(t["_id"]), t["reward"])
+        if result == TaskResult.CREDITED: await m.answer("✅ Added.")
+        elif result == TaskResult.ALREADY_DONE: await m.answer("⚠️ Done. Ye task aap pehle hi complete kar chuke hain.")
+        elif result == TaskResult.BANNED: await m.answer("🚫 You are BANNED from using this bot!")
+        else: await m.answer(f"🌙 Daily Limit ({DAILY_TASK_LIMIT}/{DAILY_TASK_LIMIT}) Reached! Kal wapis aana.")
     else: await m.answer("❌ Wrong.")
     await state.clear()
 
@@ -268,8 +290,7 @@ async def verify_task_code(m: types.Message, state: FSMContext):
 # 5. WALLET & WITHDRAW (Major Fixes Here)
 # ==========================================
 @user_router.message(F.text == "💰 Wallet / Withdraw")
-async def wallet_menu(message: types.Message):
-    user = await get_user(message.from_user.id)
+async def wallet_menu(message: types.Message, user=None):
     if not user: return
 
     bal = user.get('balance', 0.0)
@@ -304,8 +325,7 @@ async def wallet_menu(message: types.Message):
     await message.answer(msg, reply_markup=kb.as_markup())
 
 @user_router.callback_query(F.data == "req_withdraw")
-async def ask_upi(c: types.CallbackQuery, state: FSMContext):
-    user = await get_user(c.from_user.id)
+async def ask_upi(c: types.CallbackQuery, state: FSMContext, user=None):
     
     # 🛑 BAN CHECK ON BUTTON CLICK
     if user and user.get("is_banned"):
@@ -341,42 +361,16 @@ async def cancel_w(c: types.CallbackQuery, state: FSMContext):
     await c.answer("Cancelled")
 
 @user_router.message(StateFilter(UserState.waiting_for_upi_id))
-async def process_withdraw_req(m: types.Message, state: FSMContext):
+async def process_withdraw_req(m: types.Message, state: FSMContext, admin_bot=None, outbox=None):
     upi_id = m.text.strip()
     user_id = m.from_user.id
-    user = await get_user(user_id)
-    
-    # Double Check Ban
-    if user.get("is_banned"):
-        await m.answer("🚫 Transaction Failed: User Banned.")
-        await state.clear()
-        return
 
-    limit = MIN_WITHDRAW_FIRST if user.get('withdraw_count', 0) == 0 else MIN_WITHDRAW_NEXT
-    balance = user.get('balance', 0)
-    
-    if balance < limit:
-        await m.answer(f"❌ **Low Balance!**\nMin Withdraw: ₹{limit}")
-        await state.clear()
-        return
-
-# 1. Deduct Balance (Pending State)
-    result = await process_withdrawal(user_id, balance, upi_id)
-
-    # --- UPDATED LOGIC ---
-    is_success = False
-    
-    # Check 1: Agar seedha String "SUCCESS" ho
-    if result == "SUCCESS":
-        is_success = True
-    
-    # Check 2: Agar Tuple ho (e.g., ('SUCCESS', None) ya ('SUCCESS_WITH_BONUS', amt))
-    elif isinstance(result, tuple) and result[0] in ["SUCCESS", "SUCCESS_WITH_BONUS"]:
-        is_success = True
-    # ---------------------
+    # 1. Deduct Balance (Pending State) - ban/limit check isi ek atomic write me
+    withdrawal, result = await process_withdrawal(user_id, upi_id)
 
-    if is_success:
-        # ... (Baaki code same rahega: User ko msg aur Admin ko request) ...
+    if withdrawal:
+        user = result
+        balance = withdrawal["amount"]
         
         # 2. User Notification (Pending)
         await m.answer(
@@ -388,39 +382,32 @@ async def process_withdraw_req(m: types.Message, state: FSMContext):
         )
         
         # 3. Admin Notification (Private Group)
-        if PAYMENT_LOG_CHANNEL and ADMIN_BOT_TOKEN:
-            try:
-                # Use Admin Bot to send msg
-                admin_bot = Bot(token=ADMIN_BOT_TOKEN)
-                
-                kb = InlineKeyboardBuilder()
-                kb.button(text="✅ Approve", callback_data=f"wd_y_{user_id}_{balance}")
-                kb.button(text="❌ Decline", callback_data=f"wd_n_{user_id}_{balance}")
-                kb.adjust(2)
-                
-                msg_text = (
-                    "🔔 **NEW WITHDRAWAL REQUEST**\n"
-                    "━━━━━━━━━━━━━━━━\n"
-                    f"👤 Name: {user['first_name']}\n"
-                    f"📧 Email: {user.get('email')}\n"
-                    f"🆔 ID: `{user_id}`\n"
-                    f"💰 Amount: **₹{balance}**\n"
-                    f"🏦 UPI: `{upi_id}`\n"
-                    #   f"🏦 UPI: ``{upi_id}``\n"
-                   
-                    f"📅 Joined: {user.get('joining_date')}\n"
-                    f"⚠️ Status: {'BANNED' if user.get('is_banned') else 'Active'}"
-                )
-                
-                # await admin_bot.send_message(chat_id=PAYMENT_LOG_CHANNEL, text=msg_text, reply_markup=kb.as_markup())
-                await admin_bot.send_message(chat_id=PAYMENT_LOG_CHANNEL, text=msg_text, reply_markup=kb.as_markup(), parse_mode="Markdown")
-                await admin_bot.session.close() # Important
-                
-            except Exception as e:
-                print(f"❌ Admin Notification Error: {e}")
+        if PAYMENT_LOG_CHANNEL and admin_bot and outbox:
+            # Admin Bot se, outbox ki PAYMENT priority par (broadcast ke beech bhi turant)
+            kb = InlineKeyboardBuilder()
+            kb.button(text="✅ Approve", callback_data=f"wd_y_{withdrawal['_id']}")
+            kb.button(text="❌ Decline", callback_data=f"wd_n_{withdrawal['_id']}")
+            kb.adjust(2)
+            
+            msg_text = (
+                "🔔 **NEW WITHDRAWAL REQUEST**\n"
+                "━━━━━━━━━━━━━━━━\n"
+                f"👤 Name: {user['first_name']}\n"
+                f"📧 Email: {user.get('email')}\n"
+                f"🆔 ID: `{user_id}`\n"
+                f"💰 Amount: **₹{balance}**\n"
+                f"🏦 UPI: `{upi_id}`\n"
+                f"📅 Joined: {user.get('joining_date')}\n"
+                f"⚠️ Status: {'BANNED' if user.get('is_banned') else 'Active'}"
+            )
+            
+            outbox.notify(
+                admin_bot, PAYMENT_LOG_CHANNEL, msg_text,
+                reply_markup=kb.as_markup(), parse_mode="Markdown"
+            )
         
     else:
-        await m.answer(f"❌ Error: {result}")
+        await m.answer(result)
     
     await state.clear()
 
@@ -428,21 +415,38 @@ async def process_withdraw_req(m: types.Message, state: FSMContext):
 # 6. INVITE & OTHERS
 # ==========================================
 @user_router.message(F.text == "🤝 Invite & Earn")
-async def invite_menu(message: types.Message):
+async def invite_menu(message: types.Message, user=None, bot_username=None):
     user_id = message.from_user.id
-    user = await get_user(user_id)
-    bot_info = await message.bot.get_me()
-    ref_link = f"https://t.me/{bot_info.username}?start={user_id}"
+    if not user: return
+    # Username startup par hi resolve hota hai (main.py), warna bot.me() ka cached value
+    bot_username = bot_username or (await message.bot.me()).username
+    ref_link = f"https://t.me/{bot_username}?start={user_id}"
+
+    # Materialized top-N board (ek document), users par sort nahi
+    board = await get_referral_leaderboard()
+    rank = next((i for i, e in enumerate(board, 1) if e["user_id"] == user_id), None)
     msg = (
         "🤝 **REFER & EARN**\n"
         f"💰 Reward: ₹{REFERRAL_REWARD} (on friend's 1st withdraw)\n"
         f"🔗 Link: `{ref_link}`\n"
-        f"👥 Invites: `{user.get('referral_count', 0)}`"
+        f"👥 Invites: `{user.get('referral_count', 0)}`\n"
+        f"🌐 Level 2 (friends ke invites): `{user.get('referral_count_l2', 0)}`\n"
+        f"🏆 Your Rank: {f'`#{rank}`' if rank else 'Top list me abhi nahi'}"
     )
+    if board:
+        msg += "\n\n🏅 **Top Referrers**\n" + format_leaderboard(board[:5])
     kb = InlineKeyboardBuilder()
     kb.button(text="📤 Share", url=f"https://t.me/share/url?url={ref_link}&text=Join Now!")
     await message.answer(msg, reply_markup=kb.as_markup())
 
+@user_router.chat_member()
+async def on_channel_member_update(event: types.ChatMemberUpdated):
+    """Channel join/leave hote hi subscription cache update (bot channel me admin hona chahiye)"""
+    if str(event.chat.id) != str(FORCE_SUB_CHANNEL_ID): return
+    member = event.new_chat_member
+    subscribed = is_member_status(member.status)
+    subscription_cache.set(member.user.id, subscribed, ttl=SUB_CACHE_TTL if subscribed else SUB_CACHE_NEGATIVE_TTL)
+
 @user_router.message(F.text == "ℹ️ Help / Rules")
 async def cmd_help(message: types.Message):
     kb = InlineKeyboardBuilder()
@@ -0,0 +1,61 @@
+"""
+Bulk task import (task_import.py) ki row validation ke checks - koi DB / Telegram nahi chahiye.
+
+    python import_check.py
+
+Har case ek CSV row hai; galat reward (nan, inf, bahut bada, 0, negative) reject hona chahiye,
+warna wo mark_task_complete se seedha users ke balance me jaata hai.
+Koi check fail ho to exit code 1.
+"""
+import sys
+from config import MAX_TASK_REWARD
+from task_import import parse_task_file, validate_row
+
+HEADER = "title,reward,link,code,shortener"
+
+# (row, expected error ya None = valid)
+CASES = [
+    ("Ok,2.5,https://x.com/a,C1,gplinks", None),
+    (f"Max,{MAX_TASK_REWARD:g},https://x.com/a,C1,gplinks", None),
+    ("NaN,nan,https://x.com/a,C1,gplinks", "invalid reward"),
+    ("NaN upper,NaN,https://x.com/a,C1,gplinks", "invalid reward"),
+    ("Inf,inf,https://x.com/a,C1,gplinks", "invalid reward"),
+    ("Neg inf,-inf,https://x.com/a,C1,gplinks", "invalid reward"),
+    ("Infinity,Infinity,https://x.com/a,C1,gplinks", "invalid reward"),
+    ("Huge,1e308,https://x.com/a,C1,gplinks", "invalid reward"),
+    ("Over max,100.01,https://x.com/a,C1,gplinks", "invalid reward"),
+    ("Zero,0,https://x.com/a,C1,gplinks", "invalid reward"),
+    ("Negative,-5,https://x.com/a,C1,gplinks", "invalid reward"),
+    ("Text,abc,https://x.com/a,C1,gplinks", "invalid reward"),
+    ("Empty,,https://x.com/a,C1,gplinks", "invalid reward"),
+    ("Bad link,2,ftp://x.com/a,C1,gplinks", "invalid link"),
+    ("No code,2,https://x.com/a,,gplinks", "code missing"),
+    ("Bad type,2,https://x.com/a,C1,bitly", "unknown shortener"),
+]
+
+def main():
+    content = "\n".join([HEADER] + [row for row, _ in CASES]).encode()
+    rows = parse_task_file("check.csv", content)
+    failed = 0
+    for (row_no, row), (text, expected) in zip(rows, CASES):
+        result = validate_row(row)
+        error = result if isinstance(result, str) else None
+        ok = error is None if expected is None else bool(error and error.startswith(expected))
+        print(f"{'✅' if ok else '❌'} {text!r} -> {error or 'valid'}")
+        if not ok: failed += 1
+
+    # JSON me NaN/Infinity literal bhi json.loads se float ban jaate hain
+    json_rows = parse_task_file("check.json", (
+        b'[{"title": "J", "reward": NaN, "link": "https://x", "code": "c"},'
+        b' {"title": "J", "reward": Infinity, "link": "https://x", "code": "c"}]'
+    ))
+    for row_no, row in json_rows:
+        ok = isinstance(validate_row(row), str)
+        print(f"{'✅' if ok else '❌'} JSON reward {row['reward']!r} rejected")
+        if not ok: failed += 1
+
+    print(f"\n{'🎉 All checks passed' if not failed else f'💥 {failed} check(s) failed'}")
+    return failed
+
+if __name__ == "__main__":
+    sys.exit(1 if main() else 0)
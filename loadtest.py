@@ -0,0 +1,264 @@
+"""
+Load test: asli user_router (handlers/user.py) par synthetic users ki journeys chalata hai.
+
+    python loadtest.py --memory --users 500 --rate 50
+    python loadtest.py --mongo mongodb://localhost:27017 --users 2000 --rate 100 --tg-latency 0.05
+
+Journey: /start -> email -> unlock button + daily code -> Start Task -> code submit -> wallet -> withdraw.
+Telegram ki jagah stub session (koi message bahar nahi jaata). Data alag DB me jaata hai
+(--db, default 'apex_loadtest'), production DB ko touch nahi karta.
+--memory ke liye 'mongomock-motor' install hona chahiye.
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import time
+from datetime import datetime
+
+# Config import hone se pehle (stub bot ke liye valid format chahiye)
+os.environ.setdefault("BOT_TOKEN", "123456:LOADTEST-LOADTEST-LOADTEST-LOADTEST")
+os.environ.setdefault("FORCE_SUB_CHANNEL_ID", "-1001234567890")
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import GetChatMember, GetMe, SendMessage
+from aiogram.types import CallbackQuery, Chat, ChatMemberMember, Message, Update, User
+import database
+from config import SHORTENER_CONFIG
+
+DAILY_CODE = "LOADTEST"
+
+# ==========================================
+# STUB TELEGRAM
+# ==========================================
+
+class StubSession(BaseSession):
+    """Bot API ki jagah: har call 'latency' seconds baad fake response"""
+
+    def __init__(self, latency=0.0):
+        super().__init__()
+        self.latency = latency
+        self.calls = 0
+        self.message_ids = itertools.count(1)
+        self.last_markup = {} # chat_id -> last sendMessage ka inline keyboard
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls += 1
+        if self.latency: await asyncio.sleep(self.latency)
+        if isinstance(method, GetChatMember):
+            return ChatMemberMember(user=User(id=method.user_id, is_bot=False, first_name="LT"))
+        if isinstance(method, GetMe):
+            return User(id=bot.id, is_bot=True, first_name="LoadTest", username="loadtest_bot")
+        if isinstance(method, SendMessage):
+            self.last_markup[method.chat_id] = method.reply_markup
+        if "Message" in str(method.__returning__):
+            chat_id = getattr(method, "chat_id", None)
+            return Message(
+                message_id=next(self.message_ids), date=datetime.now(),
+                chat=Chat(id=chat_id if isinstance(chat_id, int) else 0, type="private"),
+                text=getattr(method, "text", None)
+            )
+        return True
+
+    def find_callback(self, chat_id, prefix):
+        markup = self.last_markup.get(chat_id)
+        for row in getattr(markup, "inline_keyboard", None) or []:
+            for button in row:
+                if button.callback_data and button.callback_data.startswith(prefix):
+                    return button.callback_data
+        return None
+
+    async def close(self):
+        pass
+
+    async def stream_content(self, *args, **kwargs):
+        yield b""
+
+# ==========================================
+# LATENCY STATS
+# ==========================================
+
+class LatencyRecorder(BaseMiddleware):
+    """Inner middleware: handler ke naam se latency samples"""
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    async def __call__(self, handler, event, data):
+        handler_object = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object else "unknown"
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            self.stats.setdefault(name, []).append(time.perf_counter() - started)
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def print_table(title, stats):
+    print(f"\n{title}")
+    print(f"{'name':<24}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, samples in sorted(stats.items(), key=lambda kv: -percentile(kv[1], 99)):
+        print(
+            f"{name:<24}{len(samples):>8}{percentile(samples, 50) * 1000:>10.1f}"
+            f"{percentile(samples, 95) * 1000:>10.1f}{percentile(samples, 99) * 1000:>10.1f}"
+            f"{max(samples) * 1000:>10.1f}"
+        )
+
+# ==========================================
+# JOURNEY
+# ==========================================
+
+class LoadTest:
+    def __init__(self, dp, bot, session, think=0.0):
+        self.dp = dp
+        self.bot = bot
+        self.session = session
+        self.think = think
+        self.update_ids = itertools.count(1)
+        self.steps = {} # step -> end-to-end samples (middlewares + handler)
+        self.errors = {}
+        self.updates = 0
+
+    def _user(self, uid):
+        return User(id=uid, is_bot=False, first_name=f"LT{uid}")
+
+    def message(self, uid, text):
+        return Update(update_id=next(self.update_ids), message=Message(
+            message_id=next(self.update_ids), date=datetime.now(),
+            chat=Chat(id=uid, type="private"), from_user=self._user(uid), text=text
+        ))
+
+    def callback(self, uid, data):
+        return Update(update_id=next(self.update_ids), callback_query=CallbackQuery(
+            id=str(next(self.update_ids)), from_user=self._user(uid), chat_instance="lt", data=data,
+            message=Message(
+                message_id=1, date=datetime.now(), chat=Chat(id=uid, type="private"), text="-"
+            )
+        ))
+
+    async def step(self, name, update):
+        started = time.perf_counter()
+        try:
+            await self.dp.feed_update(self.bot, update)
+        except Exception as e:
+            self.errors[name] = self.errors.get(name, 0) + 1
+            if self.errors[name] == 1: print(f"❌ {name}: {e!r}")
+        finally:
+            self.steps.setdefault(name, []).append(time.perf_counter() - started)
+            self.updates += 1
+        if self.think: await asyncio.sleep(self.think)
+
+    async def journey(self, uid):
+        await self.step("start", self.message(uid, "/start"))
+        await self.step("email", self.message(uid, f"lt{uid}@loadtest.local"))
+        await self.step("unlock_button", self.message(uid, "🔓 Unlock Task Today"))
+        await self.step("unlock", self.callback(uid, "ask_daily_code"))
+        await self.step("daily_code", self.message(uid, DAILY_CODE))
+        await self.step("start_task", self.message(uid, "🚀 Start Task"))
+
+        askcode = self.session.find_callback(uid, "askcode_")
+        if askcode:
+            task = await database.get_task_details(askcode.split("_")[1])
+            await self.step("askcode", self.callback(uid, askcode))
+            await self.step("submit_code", self.message(uid, task["verification_code"]))
+
+        await self.step("wallet", self.message(uid, "💰 Wallet / Withdraw"))
+        await self.step("req_withdraw", self.callback(uid, "req_withdraw"))
+        await self.step("upi", self.message(uid, f"{uid}@upi"))
+
+    async def run(self, users, rate, first_uid):
+        """'rate' journeys/sec shuru hoti hain (open model: slow server par bhi arrivals nahi rukte)"""
+        journeys = []
+        started = time.perf_counter()
+        for i in range(users):
+            journeys.append(asyncio.create_task(self.journey(first_uid + i)))
+            await asyncio.sleep(max(0.0, started + (i + 1) / rate - time.perf_counter()))
+        await asyncio.gather(*journeys)
+        return time.perf_counter() - started
+
+# ==========================================
+# SETUP
+# ==========================================
+
+async def setup_database(args):
+    if args.memory:
+        try:
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            raise SystemExit("❌ --memory ke liye 'pip install mongomock-motor' karein")
+        database.use_database(AsyncMongoMockClient()[args.db])
+        return None
+
+    if args.db == "ApexDigitalDB":
+        raise SystemExit("❌ Production DB par load test nahi chalega. --db alag rakho.")
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from metrics import MongoCommandListener
+    client = AsyncIOMotorClient(args.mongo, event_listeners=[MongoCommandListener()])
+    await client.drop_database(args.db) # Har run fresh
+    database.use_database(client[args.db])
+    await database.ensure_indexes()
+    return client
+
+async def seed(tasks):
+    types = list(SHORTENER_CONFIG)
+    for i in range(tasks):
+        await database.add_bulk_task(
+            f"Load Task {i}", 2.0, f"https://example.com/t{i}", f"LT{i}", types[i % len(types)]
+        )
+    await database.set_daily_checkin_code(DAILY_CODE)
+
+async def main(args):
+    client = await setup_database(args)
+    await seed(args.tasks)
+
+    from storage import MongoFSMStorage
+    from dispatchers import create_user_dispatcher
+    storage = MongoFSMStorage(database.fsm_col) if client else None # Memory mode: aiogram MemoryStorage
+
+    session = StubSession(latency=args.tg_latency)
+    bot = Bot(token=os.environ["BOT_TOKEN"], session=session)
+    from outbox import Outbox
+    from scheduler import Scheduler
+    scheduler = Scheduler({"user": bot})
+    dp = create_user_dispatcher(
+        storage, admin_bot=None, bot_username="loadtest_bot", outbox=Outbox(), scheduler=scheduler
+    )
+    handler_stats = {}
+    dp.message.middleware(LatencyRecorder(handler_stats))
+    dp.callback_query.middleware(LatencyRecorder(handler_stats))
+
+    test = LoadTest(dp, bot, session, think=args.think)
+    print(f"🚀 {args.users} users @ {args.rate}/s ({'memory' if args.memory else args.mongo}/{args.db})")
+    elapsed = await test.run(args.users, args.rate, first_uid=int(time.time()) * 1000)
+    await database.flush_completions()
+    await scheduler.close()
+    if storage: await storage.close()
+
+    print(f"\n⏱️ {test.updates} updates in {elapsed:.1f}s = {test.updates / elapsed:.1f} updates/s")
+    print(f"✈️ Telegram calls: {session.calls}, errors: {sum(test.errors.values())} {test.errors or ''}")
+    print_table("Per handler (handler only)", handler_stats)
+    print_table("Per step (end to end: middlewares + FSM + handler)", test.steps)
+
+    if client:
+        if not args.keep: await client.drop_database(args.db)
+        client.close()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="User bot load test")
+    parser.add_argument("--users", type=int, default=200, help="Kitne synthetic users (journeys)")
+    parser.add_argument("--rate", type=float, default=20, help="Har second kitni nayi journeys")
+    parser.add_argument("--think", type=float, default=0.0, help="Steps ke beech user ka wait (sec)")
+    parser.add_argument("--tg-latency", type=float, default=0.0, help="Fake Telegram API latency (sec)")
+    parser.add_argument("--tasks", type=int, default=50, help="Seed tasks")
+    parser.add_argument("--memory", action="store_true", help="In-memory Mongo (mongomock-motor)")
+    parser.add_argument("--mongo", default="mongodb://localhost:27017", help="Local Mongo URI")
+    parser.add_argument("--db", default="apex_loadtest")
+    parser.add_argument("--keep", action="store_true", help="Run ke baad DB drop mat karo")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
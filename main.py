@@ -2,13 +2,28 @@ import asyncio
 import logging
 import sys
 import os
-from aiogram import Bot, Dispatcher
+import hashlib
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
 from aiohttp import web
 from config import BOT_TOKEN, ADMIN_BOT_TOKEN # Dono tokens import kiye
-
-# Routers
-from handlers.user import user_router
-from handlers.admin import admin_router
+from bots import BotRegistry
+from outbox import Outbox, GLOBAL_RATE
+from scheduler import Scheduler
+from storage import MongoFSMStorage
+from broadcast import BroadcastEngine
+from dispatchers import create_user_dispatcher, create_admin_dispatcher
+from workers import WorkerPool
+from utils import close_http_session, flush_link_hits
+from metrics import loop_lag_monitor, render_metrics, set_fsm_counts
+from database import (
+    fsm_col, ensure_indexes, migrate_task_completions, load_task_pool, task_pool_refresh_loop,
+    stats_reconcile_loop, watch_settings, flush_completions, ensure_referral_leaderboard,
+    sync_caches, cache_sync_loop
+)
+from config import (
+    USE_WEBHOOK, WEBHOOK_BASE_URL, WEBHOOK_SECRET,
+    USER_WEBHOOK_PATH, ADMIN_WEBHOOK_PATH, USER_WORKERS
+)
 
 logging.basicConfig(level=logging.INFO, stream=sys.stdout)
 
@@ -17,31 +32,117 @@ if not BOT_TOKEN:
     logging.error("❌ BOT_TOKEN missing! User bot nahi chalega.")
     sys.exit(1)
 
-user_bot = Bot(token=BOT_TOKEN)
-dp_user = Dispatcher()
-# User Bot me sirf User wale commands (Tasks, Balance) honge
-dp_user.include_router(user_router)
+# Saare outgoing messages ek priority queue se (payments > replies > broadcast)
+outbox = Outbox()
+
+# Har token ka ek hi Bot (shared connection pool), handlers ko inject hoga
+bot_registry = BotRegistry(outbox=outbox)
+
+# FSM states Mongo me (restart ke baad bhi flow chalu, multi-worker safe)
+fsm_storage = MongoFSMStorage(fsm_col) if fsm_col is not None else None
+
+user_bot = bot_registry.get(BOT_TOKEN)
 
 # --- 2. SETUP ADMIN BOT (Control ke liye) ---
 admin_bot = None
-dp_admin = None
 
 if ADMIN_BOT_TOKEN:
     logging.info("✅ Admin Bot Token Found! Setting up Admin Bot...")
-    admin_bot = Bot(token=ADMIN_BOT_TOKEN)
-    dp_admin = Dispatcher()
-    # Admin Bot me sirf Admin wale commands (Add Task, Ban) honge
-    dp_admin.include_router(admin_router)
+    admin_bot = bot_registry.get(ADMIN_BOT_TOKEN)
 else:
     logging.warning("⚠️ ADMIN_BOT_TOKEN nahi mila. Sirf User Bot chalega.")
 
-# --- 3. FAKE WEB SERVER (Render Keep-Alive) ---
+# Broadcast: User Bot se bhejega, Admin Bot me progress dikhayega
+broadcaster = BroadcastEngine(outbox, sender_bot=user_bot, status_bot=admin_bot)
+
+# Delayed edits/actions (handlers asyncio.sleep nahi karte)
+scheduler = Scheduler({"user": user_bot, "admin": admin_bot})
+
+# Dispatchers main() me bante hain (dispatchers.py) - worker processes bhi
+# is file ko import karte hain, routers dobara attach nahi hone chahiye
+dp_user = None
+dp_admin = None
+
+# USER_WORKERS > 0 (webhook mode): user updates worker processes me jayenge
+worker_pool = None
+
+# --- 3. WEB SERVER (Render Keep-Alive + Webhooks) ---
 async def handle(request):
     return web.Response(text="Apex System is Live (Dual Bot Running)!")
 
-async def start_web_server():
+def get_webhook_secret(token):
+    """Har bot ka alag secret_token (Telegram sirf A-Z, a-z, 0-9, _ aur - allow karta hai)"""
+    return hashlib.sha256(f"{WEBHOOK_SECRET}:{token}".encode()).hexdigest()
+
+def webhook_enabled():
+    """Webhook mode tabhi jab URL aur secret dono set hon, warna polling"""
+    if not USE_WEBHOOK: return False
+    if not WEBHOOK_BASE_URL:
+        logging.error("❌ WEBHOOK_BASE_URL missing! Polling mode par wapis ja rahe hain.")
+        return False
+    if not WEBHOOK_SECRET:
+        # Secret token ke bina koi bhi fake update POST kar sakta hai
+        logging.error("❌ WEBHOOK_SECRET missing! Bina secret ke webhook nahi chalega. Polling mode.")
+        return False
+    return True
+
+async def handle_workers(request):
+    """Har worker ka queue depth aur load"""
+    if not worker_pool: return web.json_response({"workers": []})
+    return web.json_response(worker_pool.report())
+
+async def fsm_metrics_loop(interval=60):
+    """FSM state counts gauge timer par (har scrape par query nahi)"""
+    while True:
+        try: set_fsm_counts(await fsm_storage.count_states())
+        except Exception as e: logging.error(f"❌ FSM count failed: {e}")
+        await asyncio.sleep(interval)
+
+async def handle_metrics(request):
+    """Prometheus scrape endpoint"""
+    body, content_type = render_metrics()
+    return web.Response(body=body, headers={"Content-Type": content_type})
+
+def create_web_app():
     app = web.Application()
     app.router.add_get('/', handle)
+    app.router.add_get('/workers', handle_workers)
+    app.router.add_get('/metrics', handle_metrics)
+    return app
+
+def sharded_update_handler(secret):
+    """Update ko bas sahi worker ki queue me daalo, processing wahan hogi"""
+    async def handle_update(request):
+        if request.headers.get("X-Telegram-Bot-Api-Secret-Token") != secret:
+            return web.Response(status=401, text="Unauthorized")
+        payload = await request.json()
+        if not worker_pool.dispatch(payload):
+            return web.Response(status=503) # Telegram baad me retry karega
+        return web.Response()
+    return handle_update
+
+async def setup_webhooks(app):
+    """Dono dispatchers ko same web app par mount karo aur Telegram ko URL batao"""
+    bots = [(dp_user, user_bot, BOT_TOKEN, USER_WEBHOOK_PATH)]
+    if admin_bot:
+        bots.append((dp_admin, admin_bot, ADMIN_BOT_TOKEN, ADMIN_WEBHOOK_PATH))
+
+    for dp, bot, token, path in bots:
+        secret = get_webhook_secret(token)
+        if dp is dp_user and worker_pool:
+            app.router.add_post(path, sharded_update_handler(secret))
+        else:
+            # Galat/missing X-Telegram-Bot-Api-Secret-Token header par 401 milega
+            SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=secret).register(app, path=path)
+        await bot.set_webhook(
+            url=f"{WEBHOOK_BASE_URL}{path}",
+            secret_token=secret,
+            allowed_updates=dp.resolve_used_update_types(),
+            drop_pending_updates=True
+        )
+        logging.info(f"🔗 Webhook set: {WEBHOOK_BASE_URL}{path}")
+
+async def start_web_server(app):
     runner = web.AppRunner(app)
     await runner.setup()
     port = int(os.environ.get("PORT", 8080))
@@ -51,21 +152,89 @@ async def start_web_server():
 
 # --- 4. MAIN ENGINE ---
 async def main():
+    global dp_user, dp_admin, worker_pool
     logging.info("🚀 Starting Apex Dual Bot System...")
-    
+    use_webhook = webhook_enabled()
+    use_workers = use_webhook and USER_WORKERS > 0
+    if use_workers:
+        outbox.global_rate = GLOBAL_RATE / (USER_WORKERS + 1) # Bot ki limit sab processes me bantegi
+    outbox.start()
+    scheduler.start() # Restart se pehle ke bache jobs bhi yahi uthayega
+    await ensure_indexes()
+    await migrate_task_completions()
+    await ensure_referral_leaderboard()
+    await sync_caches()
+    await load_task_pool()
+    asyncio.create_task(cache_sync_loop())
+    asyncio.create_task(task_pool_refresh_loop())
+    asyncio.create_task(stats_reconcile_loop())
+    asyncio.create_task(watch_settings())
+    asyncio.create_task(loop_lag_monitor())
+    if fsm_storage: asyncio.create_task(fsm_metrics_loop())
+    await broadcaster.resume_pending()
+
+    # Bot identity ek hi baar (invite links ke liye)
+    me = await user_bot.me()
+
+    # Handlers me inject hone wali cheezein (workflow data)
+    dp_user = create_user_dispatcher(
+        fsm_storage,
+        admin_bot=admin_bot,        # Withdraw request payment channel me bhejne ke liye
+        bot_username=me.username,
+        outbox=outbox,
+        scheduler=scheduler
+    )
+    if admin_bot:
+        dp_admin = create_admin_dispatcher(
+            fsm_storage,
+            user_bot=user_bot,      # Approve/Decline notifications ke liye
+            broadcaster=broadcaster,
+            outbox=outbox,
+            scheduler=scheduler
+        )
+
+    if use_workers:
+        worker_pool = WorkerPool(USER_WORKERS)
+        worker_pool.start()
+        asyncio.create_task(worker_pool.log_load_loop())
+    elif USER_WORKERS > 0:
+        logging.warning("⚠️ USER_WORKERS sirf webhook mode me chalta hai. Single process mode.")
+
+    app = create_web_app()
+
+    try:
+        await run_bots(app, use_webhook)
+    finally:
+        if worker_pool: worker_pool.stop()
+        await scheduler.close() # Pending jobs Mongo me, next start par chalenge
+        await outbox.close() # Queue me bache messages bhej do
+        await close_http_session() # Shared shortener session band karo
+        await flush_link_hits() # Short link hits counter
+        if fsm_storage: await fsm_storage.close()
+        await flush_completions() # Pending completion records likh do
+        await bot_registry.close()
+
+async def run_bots(app, use_webhook):
+    if use_webhook:
+        await setup_webhooks(app)
+        await start_web_server(app)
+        logging.info("📥 Webhook Mode Active! Updates web server par aayenge.")
+        await asyncio.Event().wait() # Server chalta rahe
+        return
+
     # Conflict Errors rokne ke liye purane updates delete karo
     await user_bot.delete_webhook(drop_pending_updates=True)
     
     # Tasks list (Jo cheezein chalani hain)
     tasks = [
-        dp_user.start_polling(user_bot), # User Bot start
-        start_web_server()               # Web Server start
+        dp_user.start_polling(user_bot, close_bot_session=False), # User Bot start
+        start_web_server(app)            # Web Server start
     ]
     
     # Agar Admin Bot set hai, to use bhi chalao
     if admin_bot:
         await admin_bot.delete_webhook(drop_pending_updates=True)
-        tasks.append(dp_admin.start_polling(admin_bot))
+        tasks.append(dp_admin.start_polling(admin_bot, close_bot_session=False))
         logging.info("🛡️ Admin Bot is Active & Listening!")
     
     # Sabko ek saath run karo
@@ -0,0 +1,131 @@
+import asyncio
+import os
+import time
+from contextvars import ContextVar
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from pymongo import monitoring
+from prometheus_client import (
+    Counter, Gauge, Histogram, CollectorRegistry, CONTENT_TYPE_LATEST, REGISTRY, generate_latest
+)
+
+# NOTE: USER_WORKERS ke saath PROMETHEUS_MULTIPROC_DIR set karo, warna /metrics
+# me sirf main process (admin bot + webhook routing) ke numbers aayenge.
+
+HANDLER_LATENCY = Histogram(
+    "bot_handler_seconds", "Handler latency", ["event", "handler"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Handler exceptions", ["event", "handler"])
+
+MONGO_LATENCY = Histogram(
+    "mongo_command_seconds", "MongoDB command latency", ["command", "collection"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+)
+MONGO_ERRORS = Counter("mongo_command_errors_total", "MongoDB failed commands", ["command", "collection"])
+
+TELEGRAM_LATENCY = Histogram(
+    "telegram_api_seconds", "Telegram Bot API latency", ["method"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+TELEGRAM_ERRORS = Counter("telegram_api_errors_total", "Telegram Bot API errors", ["method", "error"])
+
+SHORTENER_LATENCY = Histogram(
+    "shortener_api_seconds", "Link shortener API latency", ["provider", "outcome"],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+
+FSM_STATES = Gauge("fsm_states", "Users currently in each FSM state", ["state"], multiprocess_mode="max")
+LOOP_LAG = Gauge("event_loop_lag_seconds", "Event loop lag (last sample)", multiprocess_mode="max")
+LOOP_LAG_HIST = Histogram(
+    "event_loop_lag_hist_seconds", "Event loop lag",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+)
+
+# Current update ka time breakdown (profiler.SlowUpdateMiddleware set karta hai).
+# Motor executor threads me bhi context copy hota hai, isliye listener bhi yahi dict dekhta hai.
+update_breakdown = ContextVar("update_breakdown", default=None)
+
+def add_timing(kind, seconds):
+    """kind: 'mongo' / 'telegram' / 'http' - chalu update ke breakdown me jodo"""
+    breakdown = update_breakdown.get()
+    if breakdown is None: return
+    breakdown[kind] += seconds
+    breakdown[f"{kind}_calls"] += 1
+
+def note_handler(name):
+    breakdown = update_breakdown.get()
+    if breakdown is not None: breakdown["handler"] = name
+
+# ==========================================
+# MONGO (pymongo command monitoring)
+# ==========================================
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Har Mongo command ka time (database.py ke saare calls isi client se jaate hain)"""
+
+    def __init__(self):
+        self.collections = {} # request_id -> collection (succeeded event me command nahi hota)
+
+    def started(self, event):
+        target = event.command.get(event.command_name)
+        self.collections[event.request_id] = target if isinstance(target, str) else ""
+
+    def succeeded(self, event):
+        collection = self.collections.pop(event.request_id, "")
+        MONGO_LATENCY.labels(event.command_name, collection).observe(event.duration_micros / 1e6)
+        add_timing("mongo", event.duration_micros / 1e6)
+
+    def failed(self, event):
+        collection = self.collections.pop(event.request_id, "")
+        MONGO_LATENCY.labels(event.command_name, collection).observe(event.duration_micros / 1e6)
+        MONGO_ERRORS.labels(event.command_name, collection).inc()
+        add_timing("mongo", event.duration_micros / 1e6)
+
+# ==========================================
+# TELEGRAM (aiogram session middleware)
+# ==========================================
+
+class TelegramMetricsMiddleware(BaseRequestMiddleware):
+    """Bot API call ka latency aur errors, method wise (sendMessage, getChatMember...)"""
+
+    async def __call__(self, make_request, bot, method):
+        name = method.__api_method__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            TELEGRAM_ERRORS.labels(name, type(e).__name__).inc()
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            TELEGRAM_LATENCY.labels(name).observe(elapsed)
+            add_timing("telegram", elapsed)
+
+# ==========================================
+# EVENT LOOP + EXPORT
+# ==========================================
+
+async def loop_lag_monitor(interval=1.0):
+    """sleep(interval) jitna late jaage, utna loop blocked tha"""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - started - interval)
+        LOOP_LAG.set(lag)
+        LOOP_LAG_HIST.observe(lag)
+
+def set_fsm_counts(counts):
+    FSM_STATES.clear() # Jo state ab khali hai wo 0 nahi, gayab ho
+    for state, count in counts.items():
+        FSM_STATES.labels(state).set(count)
+
+def render_metrics():
+    """Prometheus text format (body, content_type)"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
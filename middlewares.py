@@ -0,0 +1,37 @@
+import time
+from aiogram import BaseMiddleware
+from database import get_user
+from metrics import HANDLER_LATENCY, HANDLER_ERRORS, note_handler
+
+class UserMiddleware(BaseMiddleware):
+    """
+    Har update par user document ek hi baar load karta hai (cache se) aur
+    handlers ko 'user' argument me de deta hai. Naya user ho to None milega.
+    """
+
+    async def __call__(self, handler, event, data):
+        from_user = data.get("event_from_user")
+        data["user"] = await get_user(from_user.id) if from_user else None
+        return await handler(event, data)
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Inner middleware: handler chun liya gaya hai, uska naam aur latency
+    Prometheus histogram me jaata hai.
+    """
+
+    def __init__(self, event_name):
+        self.event_name = event_name
+
+    async def __call__(self, handler, event, data):
+        handler_object = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object else "unknown"
+        note_handler(name) # Slow update log me handler ka naam
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.labels(self.event_name, name).inc()
+            raise
+        finally:
+            HANDLER_LATENCY.labels(self.event_name, name).observe(time.perf_counter() - started)
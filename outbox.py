@@ -0,0 +1,285 @@
+import asyncio
+import itertools
+import logging
+import time
+from contextvars import ContextVar
+from datetime import datetime
+from enum import IntEnum
+from aiogram.client.default import Default
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter, TelegramNetworkError
+from aiogram.methods import SendMessage
+from database import save_dead_letter
+from metrics import add_timing, update_breakdown
+
+# --- LIMITS (Telegram: ~30 msg/sec per bot, ~1 msg/sec per chat) ---
+GLOBAL_RATE = 25          # msg/sec per bot (thoda margin rakha hai)
+CHAT_RATE = 1.0           # msg/sec per chat...
+CHAT_BURST = 3            # ...lekin 2-3 replies ek saath chal jaate hain
+OUTBOX_WORKERS = 20       # Ek saath kitni API calls
+MAX_ATTEMPTS = 3          # Network errors par
+MAX_FLOOD_WAITS = 10      # 429 (retry_after) par itni baar tak dobara
+FLOOD_WINDOW = 1.0        # Itne seconds me...
+GLOBAL_FLOOD_CHATS = 3    # ...itni alag chats ko 429 mile to poore bot ki limit maano
+
+# Ye methods queue se jaate hain (getChatMember/answerCallbackQuery jaise calls seedhe)
+QUEUED_PREFIXES = ("send", "copy", "forward", "edit")
+
+class Priority(IntEnum):
+    PAYMENT = 0      # Withdraw alerts, approval/referral notices
+    INTERACTIVE = 1  # Handlers ke replies (message.answer etc.)
+    BULK = 2         # Broadcast
+
+_in_outbox = ContextVar("in_outbox", default=False) # Worker ki apni calls dobara queue me na jayen
+
+class RateLimiter:
+    """Token bucket - global limit ke liye. 429 aane par poore bot ko pause kar deta hai."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = asyncio.Lock()
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        """
+        Token lo (sirf chhota token wait). Bot paused ho to ruko mat - pause ke bache
+        seconds return karo, caller job baad me daale. Returns 0 = token mil gaya.
+        """
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    return self.paused_until - now
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return 0
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class ChatLimiter:
+    """
+    Per-chat limit: 'burst' messages turant, phir 'rate' msg/sec (GCRA).
+    Wait nahi karta - chat ka agla slot book karke batata hai kitni der baad bhejna hai,
+    taaki ek busy chat worker ko block na kare.
+    """
+
+    def __init__(self, rate, burst):
+        self.interval = 1 / rate
+        self.burst = burst
+        self.slots = {} # chat -> next free slot (monotonic time)
+
+    def reserve(self, chat):
+        """Slot book karo. Returns seconds jitna ruk kar bhejna hai (0 = abhi)."""
+        now = time.monotonic()
+        slot = max(self.slots.get(chat, now), now)
+        self.slots[chat] = slot + self.interval
+        return max(0.0, slot - (self.burst - 1) * self.interval - now)
+
+    def pause(self, chat, seconds):
+        """429 (retry_after) sirf is chat ke liye"""
+        resume_at = time.monotonic() + seconds + (self.burst - 1) * self.interval
+        self.slots[chat] = max(self.slots.get(chat, 0.0), resume_at)
+
+    def prune(self):
+        """Khali ho chuke chats hata do (memory na badhe)"""
+        now = time.monotonic()
+        self.slots = {chat: slot for chat, slot in self.slots.items() if slot > now}
+
+class Outbox:
+    """
+    Saare outgoing Telegram messages ek queue se: payments pehle, phir replies, phir bulk.
+    Har bot ka global token bucket + har chat ka bucket, 429 par retry_after tak ruko aur
+    dobara bhejo, aur permanent failure (blocked, chat not found) dead_letters me.
+    """
+
+    def __init__(self, workers=OUTBOX_WORKERS, global_rate=GLOBAL_RATE):
+        self.size = workers
+        self.global_rate = global_rate
+        self.queue = asyncio.PriorityQueue()
+        self.limiters = {} # bot_id -> RateLimiter
+        self.chat_limiter = ChatLimiter(CHAT_RATE, CHAT_BURST)
+        self.seq = itertools.count() # Same priority me FIFO
+        self.workers = []
+        self.sent = 0
+        self.delayed = 0 # call_later se queue me wapis aane wale jobs
+        self.recent_floods = {} # bot_id -> {chat: last 429 time}
+
+    def start(self):
+        if self.workers: return
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(self.size)]
+
+    def _limiter(self, bot):
+        if bot.id not in self.limiters:
+            self.limiters[bot.id] = RateLimiter(self.global_rate)
+        return self.limiters[bot.id]
+
+    def submit(self, bot, method, priority=Priority.INTERACTIVE, execute=None, dead_letter=True):
+        """Queue me daalo. Future API ka result (ya exception) dega."""
+        job = {
+            "bot": bot,
+            "method": method,
+            "priority": priority,
+            "seq": next(self.seq),
+            "execute": execute or (lambda: bot(method)),
+            "attempts": 0,
+            "flood_waits": 0,
+            "dead_letter": dead_letter,
+            "future": asyncio.get_running_loop().create_future()
+        }
+        self._put(job)
+        return job["future"]
+
+    def _put(self, job):
+        self.start()
+        self.queue.put_nowait((job["priority"], job["seq"], job))
+
+    def _put_later(self, delay, job):
+        """Worker ko block kiye bina 'delay' baad job wapis queue me"""
+        self.delayed += 1
+        asyncio.get_running_loop().call_later(delay, self._put_delayed, job)
+
+    def _put_delayed(self, job):
+        self.delayed -= 1
+        self._put(job)
+
+    def _is_global_flood(self, bot, chat_id):
+        """Ek chat ka 429 sirf us chat ka; kai chats ko ek saath mile to bot-wide limit hai"""
+        if chat_id is None: return True
+        now = time.monotonic()
+        recent = self.recent_floods.setdefault(bot.id, {})
+        recent[chat_id] = now
+        for chat in [c for c, t in recent.items() if now - t > FLOOD_WINDOW]:
+            del recent[chat]
+        return len(recent) >= GLOBAL_FLOOD_CHATS
+
+    async def call(self, bot, method, priority=Priority.INTERACTIVE, dead_letter=False):
+        """Queue se bhejo aur result ka wait karo (errors caller ko milenge)"""
+        return await self.submit(bot, method, priority, dead_letter=dead_letter)
+
+    def notify(self, bot, chat_id, text, priority=Priority.PAYMENT, **kwargs):
+        """Fire-and-forget message. Fail hua to dead letter me, caller ko try/except nahi chahiye."""
+        future = self.submit(bot, SendMessage(chat_id=chat_id, text=text, **kwargs), priority)
+        future.add_done_callback(lambda f: f.cancelled() or f.exception()) # Unretrieved warning na aaye
+        return future
+
+    async def _worker(self):
+        _in_outbox.set(True)
+        update_breakdown.set(None) # Worker kisi update ke context me start hua ho sakta hai
+        while True:
+            _, _, job = await self.queue.get()
+            try:
+                await self._process(job)
+            except Exception as e:
+                logging.error(f"❌ Outbox worker error: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def _process(self, job):
+        if job["future"].done(): return # Caller cancel ho gaya
+        bot, method = job["bot"], job["method"]
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is not None and not job.get("chat_slot"):
+            # Chat ka slot book karo; abhi nahi hai to worker chhod do, job baad me wapis
+            delay = self.chat_limiter.reserve((bot.id, chat_id))
+            job["chat_slot"] = True
+            if delay > 0:
+                self._put_later(delay, job)
+                return
+        paused = await self._limiter(bot).acquire()
+        if paused > 0:
+            # Is bot par flood pause: worker doosre bots (admin alerts) ke liye free rahe
+            self._put_later(paused, job)
+            return
+
+        try:
+            result = await job["execute"]()
+        except TelegramRetryAfter as e:
+            # Flood control: sirf us chat ko roko (bot-wide 429 ho to poore bot ko), job wapis
+            if self._is_global_flood(bot, chat_id):
+                self._limiter(bot).pause(e.retry_after)
+            else:
+                self.chat_limiter.pause((bot.id, chat_id), e.retry_after)
+            job["flood_waits"] += 1
+            job["chat_slot"] = False # Pause ke baad naya slot
+            logging.warning(f"⏳ Flood wait {e.retry_after}s ({method.__api_method__} -> {chat_id})")
+            if job["flood_waits"] <= MAX_FLOOD_WAITS:
+                self._put(job)
+                return
+            await self._fail(job, e)
+        except TelegramNetworkError as e:
+            job["attempts"] += 1
+            if job["attempts"] < MAX_ATTEMPTS:
+                # Worker ko block kiye bina backoff ke baad wapis queue me
+                self._put_later(2 ** job["attempts"], job)
+                return
+            await self._fail(job, e)
+        except Exception as e:
+            await self._fail(job, e) # Blocked / bad request - dobara bhejne ka fayda nahi
+        else:
+            self.sent += 1
+            if self.sent % 1000 == 0: self.chat_limiter.prune()
+            if not job["future"].done(): job["future"].set_result(result)
+
+    async def _fail(self, job, error):
+        if not job["future"].done(): job["future"].set_exception(error)
+        if not job["dead_letter"]: return
+        method = job["method"]
+        logging.warning(f"📭 Dead letter: {method.__api_method__} -> {getattr(method, 'chat_id', None)}: {error}")
+        await save_dead_letter({
+            "bot_id": job["bot"].id,
+            "method": method.__api_method__,
+            "chat_id": getattr(method, "chat_id", None),
+            "payload": {
+                k: v for k, v in method.model_dump(exclude_none=True).items()
+                if not isinstance(v, Default) # Bot defaults (parse_mode) save nahi hote
+            },
+            "priority": job["priority"].name,
+            "error": f"{type(error).__name__}: {error}",
+            "attempts": job["attempts"] + job["flood_waits"] + 1,
+            "created_at": datetime.now()
+        })
+
+    async def _drain(self):
+        while True:
+            await self.queue.join()
+            if not self.delayed: return
+            await asyncio.sleep(0.1)
+
+    async def close(self, timeout=10):
+        """Bacha hua queue bhejne ka thoda time, phir workers band"""
+        if not self.workers: return
+        try:
+            await asyncio.wait_for(self._drain(), timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"⚠️ Outbox closed with {self.queue.qsize() + self.delayed} unsent messages")
+        for worker in self.workers: worker.cancel()
+        self.workers = []
+        self.chat_limiter.prune()
+
+class OutboxMiddleware(BaseRequestMiddleware):
+    """
+    Bot session par: handlers ke message.answer / edit_text bhi outbox se jaate hain
+    (INTERACTIVE priority), taaki broadcast ke beech bhi sab ek hi limit me rahe.
+    """
+
+    def __init__(self, outbox):
+        self.outbox = outbox
+
+    async def __call__(self, make_request, bot, method):
+        if _in_outbox.get() or not method.__api_method__.startswith(QUEUED_PREFIXES):
+            return await make_request(bot, method)
+        started = time.perf_counter()
+        try:
+            return await self.outbox.submit(
+                bot, method, Priority.INTERACTIVE,
+                execute=lambda: make_request(bot, method), dead_letter=False
+            )
+        finally:
+            add_timing("telegram", time.perf_counter() - started) # Queue wait bhi Telegram ka hi time hai
@@ -0,0 +1,96 @@
+import asyncio
+import cProfile
+import io
+import json
+import logging
+import pstats
+import random
+import time
+from datetime import datetime
+from aiogram import BaseMiddleware
+from config import SLOW_UPDATE_THRESHOLD, PROFILE_SAMPLE_RATE
+from database import save_slow_update
+from metrics import update_breakdown
+
+slow_log = logging.getLogger("slow_updates")
+
+class SlowUpdateMiddleware(BaseMiddleware):
+    """
+    dp.update par outer middleware: har update ka total time, aur usme se kitna
+    Mongo / Telegram / HTTP (shortener) me gaya. Threshold se slow update ek JSON
+    line me log hota hai aur slow_updates collection me jaata hai (/slow command).
+
+    sample_rate > 0 par kuch updates cProfile ke saath chalte hain. Ek time par ek hi
+    profile chalta hai, aur usme us window ke baaki concurrent updates bhi dikhenge.
+    """
+
+    _profiling = False # cProfile process me ek hi baar enable ho sakta hai
+
+    def __init__(self, bot_name, threshold=SLOW_UPDATE_THRESHOLD, sample_rate=PROFILE_SAMPLE_RATE):
+        self.bot_name = bot_name
+        self.threshold = threshold
+        self.sample_rate = sample_rate
+        self.pending_writes = set()
+
+    async def __call__(self, handler, event, data):
+        breakdown = {
+            "handler": None,
+            "mongo": 0.0, "mongo_calls": 0,
+            "telegram": 0.0, "telegram_calls": 0,
+            "http": 0.0, "http_calls": 0
+        }
+        token = update_breakdown.set(breakdown)
+        profiler = self._start_profile()
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            total = time.perf_counter() - started
+            update_breakdown.reset(token)
+            profile = self._stop_profile(profiler)
+            if total >= self.threshold:
+                self._report(event, data, breakdown, total, profile)
+
+    def _start_profile(self):
+        if not self.sample_rate or SlowUpdateMiddleware._profiling: return None
+        if random.random() >= self.sample_rate: return None
+        SlowUpdateMiddleware._profiling = True
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def _stop_profile(self, profiler, top=20):
+        if profiler is None: return None
+        profiler.disable()
+        SlowUpdateMiddleware._profiling = False
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(top)
+        return out.getvalue()
+
+    def _report(self, event, data, breakdown, total, profile):
+        from_user = data.get("event_from_user")
+        waited = breakdown["mongo"] + breakdown["telegram"] + breakdown["http"]
+        entry = {
+            "bot": self.bot_name,
+            "update_type": event.event_type,
+            "handler": breakdown["handler"] or "unhandled",
+            "user_id": from_user.id if from_user else None,
+            "total_ms": round(total * 1000, 1),
+            "mongo_ms": round(breakdown["mongo"] * 1000, 1),
+            "mongo_calls": breakdown["mongo_calls"],
+            "telegram_ms": round(breakdown["telegram"] * 1000, 1),
+            "telegram_calls": breakdown["telegram_calls"],
+            "http_ms": round(breakdown["http"] * 1000, 1),
+            "http_calls": breakdown["http_calls"],
+            # CPU + jo await measure nahi hue (gather me parallel calls ho to 0 ho sakta hai)
+            "other_ms": round(max(0.0, total - waited) * 1000, 1)
+        }
+        slow_log.warning(json.dumps(entry))
+        if profile:
+            slow_log.warning(f"🔬 Profile ({entry['handler']}):\n{profile}")
+            entry["profile"] = profile
+
+        entry["created_at"] = datetime.now()
+        task = asyncio.create_task(save_slow_update(entry))
+        self.pending_writes.add(task) # Reference rakho, warna task GC ho sakta hai
+        task.add_done_callback(self.pending_writes.discard)
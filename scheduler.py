@@ -0,0 +1,126 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from aiogram.types import InlineKeyboardMarkup
+from database import save_scheduled_jobs, claim_due_scheduled_job
+
+# Action name -> async fn(bot, **payload). Naam se resolve hota hai, taaki
+# Mongo me save hua job restart ke baad bhi chal sake.
+ACTIONS = {}
+
+def scheduled_action(name):
+    """Decorator: function ko scheduler action ke naam se register karo"""
+    def register(fn):
+        ACTIONS[name] = fn
+        return fn
+    return register
+
+def _serialize(value):
+    # Keyboards jaise aiogram objects Mongo me dict ban kar jaate hain
+    return value.model_dump(exclude_none=True) if hasattr(value, "model_dump") else value
+
+class Scheduler:
+    """
+    Delayed actions (e.g. '3 sec baad ye message edit karo') ke liye: handler job register
+    karke turant return karta hai, ek hi loop task heap se due jobs chalata hai.
+
+    - Chhote delays memory heap me; 'persist_after' se lambe seedhe Mongo (scheduled_jobs) me
+    - Shutdown par heap me bache jobs Mongo me save, next start par wahi se chalenge
+    - Har process Mongo se due jobs claim karta hai (find_one_and_delete - ek job ek hi baar)
+    """
+
+    def __init__(self, bots, persist_after=60, poll_interval=10):
+        self.bots = bots # "user"/"admin" -> Bot (job me sirf naam save hota hai)
+        self.persist_after = persist_after
+        self.poll_interval = poll_interval
+        self.heap = [] # (run_at, seq, job)
+        self.seq = itertools.count()
+        self.wakeup = asyncio.Event()
+        self.tasks = []
+        self.running = set()
+
+    def start(self):
+        if self.tasks: return
+        self.tasks = [asyncio.create_task(self._loop()), asyncio.create_task(self._poll_loop())]
+
+    async def schedule(self, delay, action, bot="user", **payload):
+        """'delay' seconds baad ACTIONS[action](bots[bot], **payload)"""
+        job = {
+            "run_at": time.time() + delay,
+            "action": action,
+            "bot": bot,
+            "payload": {k: _serialize(v) for k, v in payload.items()}
+        }
+        if delay >= self.persist_after:
+            await save_scheduled_jobs([job])
+            return
+        self.start()
+        heapq.heappush(self.heap, (job["run_at"], next(self.seq), job))
+        self.wakeup.set() # Naya job sabse pehle ho sakta hai
+
+    async def _loop(self):
+        while True:
+            self.wakeup.clear()
+            now = time.time()
+            while self.heap and self.heap[0][0] <= now:
+                _, _, job = heapq.heappop(self.heap)
+                self._run(job)
+            timeout = self.heap[0][0] - now if self.heap else None
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _poll_loop(self):
+        while True:
+            try:
+                while True:
+                    job = await claim_due_scheduled_job()
+                    if not job: break
+                    self._run(job)
+            except Exception as e:
+                logging.error(f"❌ Scheduled jobs poll failed: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    def _run(self, job):
+        task = asyncio.create_task(self._execute(job))
+        self.running.add(task) # Reference rakho, warna task GC ho sakta hai
+        task.add_done_callback(self.running.discard)
+
+    async def _execute(self, job):
+        fn = ACTIONS.get(job["action"])
+        bot = self.bots.get(job["bot"])
+        if not fn or not bot:
+            logging.error(f"❌ Scheduled action '{job['action']}' ({job['bot']}) not available")
+            return
+        try:
+            await fn(bot, **job["payload"])
+        except Exception as e:
+            logging.warning(f"⚠️ Scheduled action '{job['action']}' failed: {e}")
+
+    async def close(self):
+        for task in self.tasks: task.cancel()
+        self.tasks = []
+        if self.running:
+            await asyncio.wait(list(self.running), timeout=5)
+        if self.heap:
+            # Restart ke baad chalne ke liye Mongo me (time nikal gaya ho to turant chalenge)
+            await save_scheduled_jobs([job for _, _, job in self.heap])
+            logging.info(f"💾 Saved {len(self.heap)} pending scheduled jobs.")
+            self.heap = []
+
+# ==========================================
+# COMMON ACTIONS
+# ==========================================
+
+@scheduled_action("edit_reply_markup")
+async def edit_reply_markup(bot, chat_id, message_id, reply_markup=None):
+    markup = InlineKeyboardMarkup.model_validate(reply_markup) if reply_markup else None
+    await bot.edit_message_reply_markup(chat_id=chat_id, message_id=message_id, reply_markup=markup)
+
+@scheduled_action("edit_text")
+async def edit_text(bot, chat_id, message_id, text, reply_markup=None):
+    markup = InlineKeyboardMarkup.model_validate(reply_markup) if reply_markup else None
+    await bot.edit_message_text(text=text, chat_id=chat_id, message_id=message_id, reply_markup=markup)
@@ -0,0 +1,111 @@
+import asyncio
+import logging
+from datetime import datetime
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder
+from pymongo import UpdateOne
+from cache import LRUCache
+
+class MongoFSMStorage(BaseStorage):
+    """
+    FSM states/data Mongo me save karta hai, taaki restart/redeploy ke baad bhi
+    user ka flow (email, withdraw) chalu rahe aur multiple workers same state dekhen.
+
+    - Writes memory me jama hote hain aur har 'flush_interval' par ek bulk_write me jaate hain
+    - Chhota local read cache (read-your-writes, flush se pehle bhi)
+    - 'updated_at' par TTL index (database.ensure_indexes) purane states hata deta hai
+    """
+
+    def __init__(self, collection, flush_interval=0.5, cache_size=20000, cache_ttl=60):
+        self.col = collection
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self.flush_interval = flush_interval
+        self.cache = LRUCache(maxsize=cache_size, ttl=cache_ttl) # doc_id -> {"state", "data"}
+        self.pending = {} # doc_id -> fields jo abhi DB me likhne baaki hain
+        self.inflight = {} # Jo batch abhi bulk_write me hai (na pending me, na DB me pakka)
+        self.flush_task = None
+
+    def _doc_id(self, key):
+        return self.key_builder.build(key)
+
+    async def _load(self, doc_id):
+        entry = self.cache.get(doc_id)
+        if entry is not None: return entry
+
+        doc = await self.col.find_one({"_id": doc_id}) or {}
+        entry = {"state": doc.get("state"), "data": doc.get("data") or {}}
+        # Unflushed writes DB se naye hain (in-flight pehle, pending usse bhi naya)
+        entry.update(self.inflight.get(doc_id, {}))
+        entry.update(self.pending.get(doc_id, {}))
+        self.cache.set(doc_id, entry)
+        return entry
+
+    def _queue(self, doc_id, fields):
+        self.pending.setdefault(doc_id, {}).update(fields)
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.create_task(self._flush_loop())
+
+    async def set_state(self, key, state=None):
+        doc_id = self._doc_id(key)
+        state = state.state if isinstance(state, State) else state
+        entry = await self._load(doc_id)
+        entry["state"] = state
+        self.cache.set(doc_id, entry) # Active key ka TTL har write par naya
+        self._queue(doc_id, {"state": state})
+
+    async def get_state(self, key):
+        return (await self._load(self._doc_id(key)))["state"]
+
+    async def set_data(self, key, data):
+        doc_id = self._doc_id(key)
+        data = dict(data)
+        entry = await self._load(doc_id)
+        entry["data"] = data
+        self.cache.set(doc_id, entry)
+        self._queue(doc_id, {"data": data})
+
+    async def get_data(self, key):
+        return dict((await self._load(self._doc_id(key)))["data"])
+
+    async def flush(self):
+        """Pending writes ek bulk_write me"""
+        if not self.pending: return
+        batch, self.pending = self.pending, {}
+        self.inflight = batch # Write ke dauraan cache evict ho to bhi _load purana doc na padhe
+        now = datetime.now()
+        ops = [
+            UpdateOne({"_id": doc_id}, {"$set": {**fields, "updated_at": now}}, upsert=True)
+            for doc_id, fields in batch.items()
+        ]
+        try:
+            await self.col.bulk_write(ops, ordered=False)
+        except (Exception, asyncio.CancelledError) as e:
+            # Wapis queue me daalo - beech me aaye naye writes ko priority
+            for doc_id, fields in batch.items():
+                self.pending[doc_id] = {**fields, **self.pending.get(doc_id, {})}
+            if isinstance(e, asyncio.CancelledError): raise
+            logging.error(f"❌ FSM flush failed ({len(ops)} keys): {e}")
+        finally:
+            self.inflight = {}
+
+    async def _flush_loop(self):
+        while self.pending:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def count_states(self):
+        """State wise active users (monitoring ke liye). Partial 'state' index se, cleared docs scan nahi hote."""
+        pipeline = [
+            {"$match": {"state": {"$type": "string"}}}, # Index ke partialFilterExpression jaisa hi
+            {"$group": {"_id": "$state", "count": {"$sum": 1}}}
+        ]
+        return {d["_id"]: d["count"] async for d in self.col.aggregate(pipeline)}
+
+    async def close(self):
+        if self.flush_task and not self.flush_task.done():
+            self.flush_task.cancel()
+            try:
+                await self.flush_task
+            except asyncio.CancelledError:
+                pass
+        await self.flush() # Shutdown par bacha hua sab likh do
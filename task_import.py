@@ -0,0 +1,123 @@
+import asyncio
+import csv
+import io
+import json
+import math
+from config import SHORTENER_CONFIG, MAX_TASK_REWARD
+from database import add_tasks_bulk
+from utils import shorten_link
+
+# Ek saath kitni shortener API calls (providers ko flood na karein)
+SHORTEN_WORKERS = 5
+MAX_ROWS = 2000
+FIELDS = ("title", "reward", "link", "code", "shortener")
+
+def parse_task_file(filename, content):
+    """
+    CSV (header: title,reward,link,code,shortener) ya JSON (same keys ki list).
+    shortener = gplinks / shrinkme / shrinkearn / all. Returns list of (row_no, dict).
+    """
+    text = content.decode("utf-8-sig")
+    if filename.lower().endswith(".json"):
+        data = json.loads(text)
+        if isinstance(data, dict): data = data.get("tasks", [])
+        if not isinstance(data, list): raise ValueError("JSON me tasks ki list chahiye")
+        rows = data
+    else:
+        reader = csv.DictReader(io.StringIO(text))
+        if not reader.fieldnames: raise ValueError("CSV khali hai")
+        reader.fieldnames = [f.strip().lower() for f in reader.fieldnames]
+        missing = [f for f in FIELDS if f not in reader.fieldnames and f != "shortener"]
+        if missing: raise ValueError(f"CSV header me missing: {', '.join(missing)}")
+        rows = list(reader)
+
+    if len(rows) > MAX_ROWS: raise ValueError(f"Ek file me max {MAX_ROWS} rows")
+    # Row number file ke hisaab se (CSV me header line 1 hai)
+    start = 1 if filename.lower().endswith(".json") else 2
+    return [(start + i, row) for i, row in enumerate(rows)]
+
+def parse_reward(value):
+    """Returns reward (0 < reward <= MAX_TASK_REWARD) ya None. nan/inf balance kharab kar dete."""
+    try:
+        reward = float(str(value).strip())
+    except ValueError:
+        return None
+    if not math.isfinite(reward) or reward <= 0 or reward > MAX_TASK_REWARD:
+        return None
+    return reward
+
+def validate_row(row):
+    """Returns (task fields, shortener types) ya error message"""
+    if not isinstance(row, dict): return "row object nahi hai"
+    row = {str(k).strip().lower(): str(v).strip() if v is not None else "" for k, v in row.items()}
+    title, link, code = row.get("title"), row.get("link"), row.get("code")
+    if not title: return "title missing"
+    if not code: return "code missing"
+    if not link or not link.startswith("http"): return "invalid link"
+    reward = parse_reward(row.get("reward", ""))
+    if reward is None: return f"invalid reward (0 se zyada, max {MAX_TASK_REWARD:g})"
+
+    shortener = (row.get("shortener") or "all").lower()
+    if shortener == "all":
+        types = list(SHORTENER_CONFIG)
+    elif shortener in SHORTENER_CONFIG:
+        types = [shortener]
+    else:
+        return f"unknown shortener '{shortener}'"
+    return {"title": title, "reward": reward, "link": link, "code": code}, types
+
+async def import_tasks(filename, content):
+    """
+    File ke saare valid rows ke tasks banata hai. Returns report:
+    list of {"row", "status" (ok/warn/error), "title", "shortener", "detail"}.
+    """
+    report = []
+    pending = [] # (row_no, fields, shortener_type)
+    for row_no, row in parse_task_file(filename, content):
+        result = validate_row(row)
+        if isinstance(result, str):
+            title = row.get("title", "") if isinstance(row, dict) else ""
+            report.append({"row": row_no, "status": "error", "title": title, "shortener": "", "detail": result})
+            continue
+        fields, types = result
+        pending.extend((row_no, fields, s) for s in types)
+
+    # Har unique (link, shortener) ek hi baar, bounded concurrency ke saath
+    limiter = asyncio.Semaphore(SHORTEN_WORKERS)
+    async def shorten(link, shortener_type):
+        async with limiter:
+            return await shorten_link(link, shortener_type)
+
+    keys = list({(fields["link"], s) for _, fields, s in pending})
+    shortened = dict(zip(keys, await asyncio.gather(*(shorten(*k) for k in keys))))
+
+    tasks = []
+    for row_no, fields, s in pending:
+        short = shortened[(fields["link"], s)]
+        tasks.append({
+            "text": f"{fields['title']} ({s.upper()})",
+            "reward": fields["reward"],
+            "link": short,
+            "verification_code": fields["code"],
+            "shortener_type": s
+        })
+    errors = await add_tasks_bulk(tasks)
+
+    for i, (row_no, fields, s) in enumerate(pending):
+        if i in errors:
+            status, detail = "error", errors[i]
+        elif tasks[i]["link"] == fields["link"] and SHORTENER_CONFIG[s]["key"]:
+            status, detail = "warn", "shortener fail, original link use hua"
+        else:
+            status, detail = "ok", tasks[i]["link"]
+        report.append({"row": row_no, "status": status, "title": fields["title"], "shortener": s, "detail": detail})
+
+    report.sort(key=lambda r: r["row"])
+    return report
+
+def report_to_csv(report):
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=["row", "status", "title", "shortener", "detail"])
+    writer.writeheader()
+    writer.writerows(report)
+    return out.getvalue().encode()
@@ -0,0 +1,69 @@
+import random
+
+class TaskPool:
+    """
+    Har shortener_type ke active tasks memory me rakhta hai.
+    Next task pick karna O(1) hai (random probe + set membership check),
+    har "Start Task" par DB aggregation nahi chalani padti.
+    """
+
+    def __init__(self, probes=8):
+        self.probes = probes
+        self.pools = {}      # shortener_type -> [task_id, ...]
+        self.positions = {}  # task_id -> index in its pool (O(1) remove ke liye)
+        self.tasks = {}      # task_id -> task document
+        self.loaded = False
+
+    def load(self, tasks):
+        """Poora pool dobara banao (startup / periodic refresh)"""
+        self.pools = {}
+        self.positions = {}
+        self.tasks = {}
+        for task in tasks:
+            self.add(task)
+        self.loaded = True
+
+    def add(self, task):
+        task_id = task["_id"]
+        if task_id in self.tasks:
+            self.tasks[task_id] = task
+            return
+        pool = self.pools.setdefault(task.get("shortener_type"), [])
+        self.positions[task_id] = len(pool)
+        pool.append(task_id)
+        self.tasks[task_id] = task
+
+    def remove(self, task_id):
+        task = self.tasks.pop(task_id, None)
+        if not task: return False
+
+        # Swap-remove: last element ko khali jagah par le aao
+        pool = self.pools[task.get("shortener_type")]
+        index = self.positions.pop(task_id)
+        last_id = pool.pop()
+        if last_id != task_id:
+            pool[index] = last_id
+            self.positions[last_id] = index
+        return True
+
+    def get(self, task_id):
+        return self.tasks.get(task_id)
+
+    def count(self, shortener_type=None):
+        if shortener_type is None: return len(self.tasks)
+        return len(self.pools.get(shortener_type, []))
+
+    def pick(self, shortener_type, exclude=()):
+        """Random task jo 'exclude' me nahi hai, warna None"""
+        pool = self.pools.get(shortener_type)
+        if not pool: return None
+
+        for _ in range(self.probes):
+            task_id = random.choice(pool)
+            if task_id not in exclude:
+                return self.tasks[task_id]
+
+        # User ne is type ke zyada tar tasks kar liye hain - bache hue me se chuno
+        remaining = [t for t in pool if t not in exclude]
+        if not remaining: return None
+        return self.tasks[random.choice(remaining)]
@@ -1,5 +1,82 @@
+import asyncio
+import logging
+import random
+import re
+import time
+from collections import Counter
 import aiohttp
-from config import SHORTENER_CONFIG
+from cache import LRUCache
+from config import SHORTENER_CONFIG, SHORTENER_RETRIES, SHORT_LINK_TTL
+from database import get_cached_short_link, save_short_link, bump_short_link_hits
+from metrics import SHORTENER_LATENCY, add_timing
+
+# --- SHARED HTTP SESSION (Connection pooling + DNS cache) ---
+_http_session = None
+
+def get_http_session():
+    """Poori app ke liye ek hi ClientSession (har call par naya TLS handshake nahi)"""
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        connector = aiohttp.TCPConnector(limit=100, limit_per_host=20, ttl_dns_cache=300)
+        _http_session = aiohttp.ClientSession(connector=connector)
+    return _http_session
+
+async def close_http_session():
+    global _http_session
+    if _http_session and not _http_session.closed:
+        await _http_session.close()
+    _http_session = None
+
+# --- SHORT LINK CACHE (Memory LRU -> Mongo -> Shortener API) ---
+short_link_cache = LRUCache(maxsize=2000, ttl=SHORT_LINK_TTL)
+link_cache_stats = {"memory_hits": 0, "db_hits": 0, "misses": 0}
+
+def get_link_cache_stats():
+    return dict(link_cache_stats)
+
+# Memory hits ka DB counter background me batch se (hit path par DB round trip nahi)
+_pending_hits = Counter()
+_hits_flush_task = None
+
+def _record_hit(key):
+    global _hits_flush_task
+    _pending_hits[key] += 1
+    if _hits_flush_task is None or _hits_flush_task.done():
+        _hits_flush_task = asyncio.create_task(_hits_flush_loop())
+
+async def flush_link_hits():
+    if not _pending_hits: return
+    counts = dict(_pending_hits)
+    _pending_hits.clear()
+    await bump_short_link_hits(counts)
+
+async def _hits_flush_loop(interval=30):
+    while _pending_hits:
+        await asyncio.sleep(interval)
+        try:
+            await flush_link_hits()
+        except Exception as e:
+            logging.error(f"❌ Link hits flush failed: {e}") # Sirf stats hain, drop theek hai
+
+async def _request_short_link(config, destination_url):
+    # Teeno websites ka format same hai: ?api=KEY&url=URL
+    params = {
+        'api': config["key"],
+        'url': destination_url
+    }
+    timeout = aiohttp.ClientTimeout(total=config.get("timeout", 10))
+    async with get_http_session().get(config["url"], params=params, timeout=timeout) as resp:
+        if resp.status >= 500:
+            raise aiohttp.ClientResponseError(resp.request_info, resp.history, status=resp.status)
+        data = await resp.json(content_type=None)
+
+        # Alag-alag APIs alag response de sakti hain
+        if "shortenedUrl" in data:
+            return data["shortenedUrl"]
+        elif "short" in data:
+            return data["short"]
+        else:
+            return destination_url # Fail hua to original link
 
 async def shorten_link(destination_url, shortener_type):
     """
@@ -7,28 +84,59 @@ async def shorten_link(destination_url, shortener_type):
     shortener_type: 'gplinks', 'shrinkme', 'shrinkearn'
     """
     config = SHORTENER_CONFIG.get(shortener_type)
-    
+
     # Agar config nahi mila ya Key missing hai
     if not config or not config["key"]:
-        return destination_url 
-
-    try:
-        async with aiohttp.ClientSession() as session:
-            # Teeno websites ka format same hai: ?api=KEY&url=URL
-            params = {
-                'api': config["key"],
-                'url': destination_url
-            }
-            async with session.get(config["url"], params=params) as resp:
-                data = await resp.json()
-                
-                # Alag-alag APIs alag response de sakti hain
-                if "shortenedUrl" in data:
-                    return data["shortenedUrl"]
-                elif "short" in data: 
-                    return data["short"]
-                else:
-                    return destination_url # Fail hua to original link
-    except Exception as e:
-        print(f"❌ Shortener Error ({shortener_type}): {e}")
-        return destination_url
\ No newline at end of file
+        return destination_url
+
+    key = (destination_url, shortener_type)
+    cached = short_link_cache.get(key)
+    if cached:
+        link_cache_stats["memory_hits"] += 1
+        _record_hit(key)
+        return cached
+
+    cached = await get_cached_short_link(destination_url, shortener_type)
+    if cached:
+        link_cache_stats["db_hits"] += 1
+        short_link_cache.set(key, cached)
+        return cached
+
+    link_cache_stats["misses"] += 1
+    short = destination_url
+    for attempt in range(SHORTENER_RETRIES + 1):
+        started = time.perf_counter()
+        try:
+            short = await _request_short_link(config, destination_url)
+            outcome = "ok" if short != destination_url else "fallback"
+            SHORTENER_LATENCY.labels(shortener_type, outcome).observe(time.perf_counter() - started)
+            add_timing("http", time.perf_counter() - started)
+            break
+        except Exception as e:
+            SHORTENER_LATENCY.labels(shortener_type, "error").observe(time.perf_counter() - started)
+            add_timing("http", time.perf_counter() - started)
+            print(f"❌ Shortener Error ({shortener_type}, try {attempt + 1}): {e}")
+            if attempt < SHORTENER_RETRIES:
+                # Exponential backoff + jitter (sab retries ek saath na lagen)
+                await asyncio.sleep((0.5 * 2 ** attempt) * random.uniform(0.5, 1.5))
+
+    if short != destination_url: # Fail hua link cache nahi karna
+        short_link_cache.set(key, short)
+        await save_short_link(destination_url, shortener_type, short)
+    return short
+
+async def shorten_links_batch(destination_url, shortener_types):
+    """Saare shorteners ek saath call karega. Returns {shortener_type: short_url}"""
+    results = await asyncio.gather(*(shorten_link(destination_url, s) for s in shortener_types))
+    return dict(zip(shortener_types, results))
+
+# --- LEADERBOARD TEXT ---
+_MARKDOWN_CHARS = re.compile(r"[_*`\[\]]") # Naam me ye ho to Markdown message tod dete hain
+_MEDALS = {1: "🥇", 2: "🥈", 3: "🥉"}
+
+def format_leaderboard(entries):
+    """Leaderboard entries -> '🥇 Name - `count`' lines"""
+    return "\n".join(
+        f"{_MEDALS.get(i, f'{i}.')} {_MARKDOWN_CHARS.sub('', e['name'])[:20]} - `{e['count']}`"
+        for i, e in enumerate(entries, 1)
+    )
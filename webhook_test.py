@@ -0,0 +1,220 @@
+"""
+Webhook mode ka local test: fake Telegram client dono webhook paths par updates POST karta hai.
+
+    python webhook_test.py --memory
+    python webhook_test.py --mongo mongodb://localhost:27017
+
+Check karta hai ki:
+- sahi secret header par update 200 ke saath sahi bot ke dispatcher tak pahunche
+- galat / missing / doosre bot ka secret par 401 mile aur update process na ho
+- USER_WORKERS mode me user path worker queue (sharded handler) me jaaye
+Koi asli Telegram call nahi hoti (stub session), data alag DB (--db) me.
+Koi check fail ho to exit code 1.
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import sys
+from datetime import datetime
+
+# main/config import hone se pehle: webhook mode + fake tokens
+os.environ.setdefault("BOT_TOKEN", "123456:WEBHOOKTEST-USER-WEBHOOKTEST-USER")
+os.environ.setdefault("ADMIN_BOT_TOKEN", "654321:WEBHOOKTEST-ADMIN-WEBHOOKTEST-ADMIN")
+os.environ.setdefault("FORCE_SUB_CHANNEL_ID", "-1001234567890")
+os.environ["ADMIN_IDS"] = "999"
+os.environ["USE_WEBHOOK"] = "true"
+os.environ["WEBHOOK_BASE_URL"] = "https://webhook-test.local"
+os.environ["WEBHOOK_SECRET"] = "webhook-test-secret"
+
+import aiohttp
+from aiohttp.test_utils import TestServer
+from aiogram.methods import SendMessage
+from loadtest import StubSession, setup_database
+from metrics import TelegramMetricsMiddleware
+from outbox import OutboxMiddleware
+import main
+
+ADMIN_ID = 999
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+class FakeWorkerPool:
+    """USER_WORKERS mode: sharded handler ke updates yahan aate hain"""
+
+    def __init__(self):
+        self.payloads = []
+
+    def dispatch(self, payload):
+        self.payloads.append(payload)
+        return True
+
+class FakeTelegram:
+    """Telegram ki tarah webhook URL par update JSON POST karta hai"""
+
+    def __init__(self, server):
+        self.server = server
+        self.ids = itertools.count(1)
+        self.http = aiohttp.ClientSession()
+
+    def message_update(self, user_id, text):
+        return {
+            "update_id": next(self.ids),
+            "message": {
+                "message_id": next(self.ids),
+                "date": int(datetime.now().timestamp()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": user_id, "is_bot": False, "first_name": f"WH{user_id}"},
+                "text": text
+            }
+        }
+
+    async def post(self, path, update, secret=None):
+        headers = {SECRET_HEADER: secret} if secret is not None else {}
+        async with self.http.post(self.server.make_url(path), json=update, headers=headers) as resp:
+            return resp.status
+
+    async def close(self):
+        await self.http.close()
+
+# ==========================================
+# CHECKS
+# ==========================================
+
+class Checks:
+    def __init__(self):
+        self.failed = 0
+
+    def expect(self, name, ok, detail=""):
+        print(f"{'✅' if ok else '❌'} {name}{f' ({detail})' if detail and not ok else ''}")
+        if not ok: self.failed += 1
+
+async def replied(session, chat_id, timeout=3.0):
+    """SimpleRequestHandler update background me chalata hai - reply ka wait"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while loop.time() < deadline:
+        if chat_id in session.sent_to: return True
+        await asyncio.sleep(0.05)
+    return False
+
+def stub_bot(bot):
+    """Bot ki session stub se badlo, middlewares wahi jo BotRegistry lagata hai"""
+    session = StubSession()
+    session.sent_to = set()
+    make_request = session.make_request
+    async def record(bot, method, timeout=None):
+        if isinstance(method, SendMessage): session.sent_to.add(method.chat_id)
+        return await make_request(bot, method, timeout)
+    session.make_request = record
+    session.middleware(OutboxMiddleware(main.outbox))
+    session.middleware(TelegramMetricsMiddleware())
+    bot.session = session
+    return session
+
+async def start_app():
+    app = main.create_web_app()
+    await main.setup_webhooks(app)
+    server = TestServer(app)
+    await server.start_server()
+    return server
+
+async def check_direct_mode(checks, user_session, admin_session):
+    """USER_WORKERS=0: dono paths seedhe dispatchers (SimpleRequestHandler)"""
+    server = await start_app()
+    telegram = FakeTelegram(server)
+    user_secret = main.get_webhook_secret(main.BOT_TOKEN)
+    admin_secret = main.get_webhook_secret(main.ADMIN_BOT_TOKEN)
+    user_path, admin_path = main.USER_WEBHOOK_PATH, main.ADMIN_WEBHOOK_PATH
+
+    status = await telegram.post(user_path, telegram.message_update(101, "/start"), user_secret)
+    checks.expect("user path + user secret -> 200", status == 200, status)
+    checks.expect("user update handled by user bot", await replied(user_session, 101))
+    checks.expect("user update not sent by admin bot", 101 not in admin_session.sent_to)
+
+    status = await telegram.post(admin_path, telegram.message_update(ADMIN_ID, "/start"), admin_secret)
+    checks.expect("admin path + admin secret -> 200", status == 200, status)
+    checks.expect("admin update handled by admin bot", await replied(admin_session, ADMIN_ID))
+    checks.expect("admin update not sent by user bot", ADMIN_ID not in user_session.sent_to)
+
+    for name, path, secret, chat_id in [
+        ("user path + wrong secret", user_path, "wrong", 102),
+        ("user path + no secret", user_path, None, 103),
+        ("user path + admin secret", user_path, admin_secret, 104),
+        ("admin path + user secret", admin_path, user_secret, 105),
+    ]:
+        status = await telegram.post(path, telegram.message_update(chat_id, "/start"), secret)
+        checks.expect(f"{name} -> 401", status == 401, status)
+        await asyncio.sleep(0.2)
+        checks.expect(f"{name} not processed", chat_id not in user_session.sent_to | admin_session.sent_to)
+
+    await telegram.close()
+    await server.close()
+
+async def check_sharded_mode(checks):
+    """USER_WORKERS>0: user path sirf worker queue me daalta hai"""
+    main.worker_pool = FakeWorkerPool()
+    server = await start_app()
+    telegram = FakeTelegram(server)
+    user_secret = main.get_webhook_secret(main.BOT_TOKEN)
+
+    update = telegram.message_update(201, "/start")
+    status = await telegram.post(main.USER_WEBHOOK_PATH, update, user_secret)
+    checks.expect("sharded user path + secret -> 200", status == 200, status)
+    checks.expect("sharded update queued for workers", main.worker_pool.payloads == [update])
+
+    status = await telegram.post(main.USER_WEBHOOK_PATH, telegram.message_update(202, "/start"), "wrong")
+    checks.expect("sharded user path + wrong secret -> 401", status == 401, status)
+    checks.expect("rejected update not queued", len(main.worker_pool.payloads) == 1)
+
+    await telegram.close()
+    await server.close()
+    main.worker_pool = None
+
+# ==========================================
+# SETUP
+# ==========================================
+
+async def run(args):
+    client = await setup_database(args)
+    main.outbox.start()
+    user_session = stub_bot(main.user_bot)
+    admin_session = stub_bot(main.admin_bot)
+
+    from dispatchers import create_user_dispatcher, create_admin_dispatcher
+    main.dp_user = create_user_dispatcher(
+        None, admin_bot=main.admin_bot, bot_username="webhook_test_bot",
+        outbox=main.outbox, scheduler=main.scheduler
+    )
+    main.dp_admin = create_admin_dispatcher(
+        None, user_bot=main.user_bot, broadcaster=main.broadcaster,
+        outbox=main.outbox, scheduler=main.scheduler
+    )
+
+    checks = Checks()
+    checks.expect("webhook mode enabled with secret", main.webhook_enabled())
+    main.WEBHOOK_SECRET = None
+    checks.expect("webhook mode refused without secret", not main.webhook_enabled())
+    main.WEBHOOK_SECRET = os.environ["WEBHOOK_SECRET"]
+
+    await check_direct_mode(checks, user_session, admin_session)
+    await check_sharded_mode(checks)
+
+    await main.scheduler.close()
+    await main.outbox.close(timeout=2)
+    if client:
+        if not args.keep: await client.drop_database(args.db)
+        client.close()
+
+    print(f"\n{'🎉 All checks passed' if not checks.failed else f'💥 {checks.failed} check(s) failed'}")
+    return checks.failed
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Webhook mode test (fake Telegram client)")
+    parser.add_argument("--memory", action="store_true", help="In-memory Mongo (mongomock-motor)")
+    parser.add_argument("--mongo", default="mongodb://localhost:27017", help="Local Mongo URI")
+    parser.add_argument("--db", default="apex_webhooktest")
+    parser.add_argument("--keep", action="store_true", help="Run ke baad DB drop mat karo")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    sys.exit(1 if asyncio.run(run(parse_args())) else 0)
@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import multiprocessing
+import sys
+import time
+from config import BOT_TOKEN, ADMIN_BOT_TOKEN, USER_WORKERS
+
+# Stats array me har worker ke 4 slots
+PROCESSED, FAILED, INFLIGHT, BUSY_SECONDS = range(4)
+STATS_FIELDS = 4
+
+def get_update_user_id(payload):
+    """Raw update JSON se user_id (isi se shard decide hota hai)"""
+    for key, value in payload.items():
+        if key == "update_id" or not isinstance(value, dict): continue
+        if key in ("chat_member", "my_chat_member"):
+            # Subscription cache isi user ke worker me update hona chahiye
+            return value.get("new_chat_member", {}).get("user", {}).get("id", 0)
+        user = value.get("from") or value.get("user") or value.get("chat") or {}
+        return user.get("id", 0)
+    return 0
+
+class WorkerPool:
+    """
+    User Bot updates ko N processes me baantta hai. Same user ke updates hamesha
+    same worker me jaate hain (user_id % N), aur wahan order me process hote hain.
+    """
+
+    def __init__(self, size, max_queue=10000):
+        self.size = size
+        self.ctx = multiprocessing.get_context("spawn") # Fork se routers/loop copy nahi hone chahiye
+        self.queues = [self.ctx.Queue(max_queue) for _ in range(size)]
+        self.stats = self.ctx.Array("d", size * STATS_FIELDS, lock=False)
+        self.processes = []
+        self.dropped = 0
+
+    def start(self):
+        for index in range(self.size):
+            proc = self.ctx.Process(
+                target=worker_main, args=(index, self.queues[index], self.stats),
+                name=f"user-worker-{index}", daemon=True
+            )
+            proc.start()
+            self.processes.append(proc)
+        logging.info(f"👷 Started {self.size} user worker processes.")
+
+    def dispatch(self, payload):
+        user_id = get_update_user_id(payload)
+        try:
+            self.queues[user_id % self.size].put_nowait(payload)
+            return True
+        except Exception:
+            self.dropped += 1 # Queue full: Telegram webhook retry karega
+            return False
+
+    def report(self):
+        workers = []
+        for index in range(self.size):
+            base = index * STATS_FIELDS
+            try: depth = self.queues[index].qsize()
+            except NotImplementedError: depth = -1 # macOS par qsize nahi hota
+            workers.append({
+                "worker": index,
+                "alive": self.processes[index].is_alive() if self.processes else False,
+                "queue_depth": depth,
+                "processed": int(self.stats[base + PROCESSED]),
+                "failed": int(self.stats[base + FAILED]),
+                "inflight": int(self.stats[base + INFLIGHT]),
+                "busy_seconds": round(self.stats[base + BUSY_SECONDS], 2)
+            })
+        return {"workers": workers, "dropped": self.dropped}
+
+    async def log_load_loop(self, interval=60):
+        while True:
+            await asyncio.sleep(interval)
+            for w in self.report()["workers"]:
+                logging.info(
+                    f"👷 Worker {w['worker']}: queue={w['queue_depth']} inflight={w['inflight']} "
+                    f"processed={w['processed']} busy={w['busy_seconds']}s"
+                )
+
+    def stop(self, timeout=10):
+        for queue in self.queues:
+            try: queue.put_nowait(None) # Shutdown signal
+            except Exception: pass
+        for proc in self.processes:
+            proc.join(timeout)
+            if proc.is_alive(): proc.terminate()
+
+# ==========================================
+# WORKER PROCESS
+# ==========================================
+
+def worker_main(index, queue, stats):
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout)
+    try:
+        asyncio.run(_worker_loop(index, queue, stats))
+    except KeyboardInterrupt:
+        pass
+
+async def _worker_loop(index, queue, stats, concurrency=100):
+    # Worker ke andar imports - har process apna DB client, bots aur dispatcher banata hai
+    from bots import BotRegistry
+    from outbox import Outbox, GLOBAL_RATE
+    from scheduler import Scheduler
+    from storage import MongoFSMStorage
+    from dispatchers import create_user_dispatcher
+    from metrics import loop_lag_monitor
+    from database import (
+        fsm_col, load_task_pool, task_pool_refresh_loop, watch_settings, flush_completions,
+        sync_caches, cache_sync_loop
+    )
+
+    # Bot ki global limit main process + saare workers me barabar bantegi
+    outbox = Outbox(global_rate=GLOBAL_RATE / (USER_WORKERS + 1))
+    outbox.start()
+    registry = BotRegistry(outbox=outbox)
+    user_bot = registry.get(BOT_TOKEN)
+    storage = MongoFSMStorage(fsm_col) if fsm_col is not None else None
+    admin_bot = registry.get(ADMIN_BOT_TOKEN)
+    scheduler = Scheduler({"user": user_bot, "admin": admin_bot})
+    scheduler.start()
+    me = await user_bot.me()
+    dp = create_user_dispatcher(
+        storage, admin_bot=admin_bot, bot_username=me.username, outbox=outbox, scheduler=scheduler
+    )
+
+    await sync_caches() # Baseline version pool load se pehle (beech ka change miss na ho)
+    await load_task_pool()
+    background = [
+        asyncio.create_task(cache_sync_loop()), # Admin ke task/user changes kuch second me
+        asyncio.create_task(task_pool_refresh_loop()),
+        asyncio.create_task(watch_settings()),
+        asyncio.create_task(loop_lag_monitor())
+    ]
+
+    base = index * STATS_FIELDS
+    limiter = asyncio.Semaphore(concurrency)
+    tails = {} # user_id -> us user ka last task (order maintain karne ke liye)
+    loop = asyncio.get_running_loop()
+
+    async def process(payload, previous):
+        if previous:
+            await asyncio.wait([previous]) # Pehle wala update khatam hone do
+        async with limiter:
+            stats[base + INFLIGHT] += 1
+            started = time.monotonic()
+            try:
+                await dp.feed_raw_update(user_bot, payload)
+                stats[base + PROCESSED] += 1
+            except Exception as e:
+                stats[base + FAILED] += 1
+                logging.error(f"❌ Worker {index} update failed: {e}")
+            finally:
+                stats[base + INFLIGHT] -= 1
+                stats[base + BUSY_SECONDS] += time.monotonic() - started
+
+    def forget(user_id, task):
+        if tails.get(user_id) is task: del tails[user_id]
+
+    logging.info(f"👷 Worker {index} ready.")
+    try:
+        while True:
+            payload = await loop.run_in_executor(None, queue.get)
+            if payload is None: break
+            user_id = get_update_user_id(payload)
+            task = asyncio.create_task(process(payload, tails.get(user_id)))
+            tails[user_id] = task
+            task.add_done_callback(lambda t, uid=user_id: forget(uid, t))
+    finally:
+        if tails:
+            await asyncio.wait(list(tails.values()), timeout=10)
+        for task in background: task.cancel()
+        if storage: await storage.close()
+        await flush_completions()
+        await scheduler.close()
+        await outbox.close()
+        await registry.close()